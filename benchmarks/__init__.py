@@ -0,0 +1 @@
+"""Headless benchmarks, run from the project root with ``python -m benchmarks.<name>``."""
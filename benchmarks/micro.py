@@ -0,0 +1,255 @@
+"""Micro-benchmarks of hot paths over map sizes and entity counts.
+
+Compare against stored baselines and fail if any case regressed, or if a case is slower than the alternative it is
+expected to beat, see :any:`EXPECTED_FASTER`::
+
+    python -m benchmarks.micro --save-baseline  # Record a baseline on this machine.
+    python -m benchmarks.micro  # Compare with the baseline.
+    python -m benchmarks.micro --full  # Include 2048x2048 maps and 10000 entities.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+from typing import Final
+
+import attrs
+import numpy as np
+import tcod.console
+import tcod.ecs
+
+from game.actions import SEARCH_RADIUS, FollowPath
+from game.actor_logic import get_fov
+from game.components import Location, Shape
+from game.fov import FOVCache
+from game.map_gen import CaveConfig, generate_cave_floor
+from game.path_hierarchy import PathHierarchy
+from game.pathfinding import FlowFieldCache, compute_flow_field, find_path, get_terrain_cost, positions_to_roots
+from game.rendering import render_world
+from game.saving import SaveJournal, load_world, save_world
+from game.tags import IsActor, IsPlayer
+from game.timesys import next_ticket, schedule
+from game.travel import check_move, iter_entity_locations
+from game.world_init import new_world
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+"""Default baseline file, baselines are only comparable on the machine which recorded them."""
+
+MAP_SIZES = (128, 512)
+ENTITY_COUNTS = (10, 1000)
+FULL_MAP_SIZES = (128, 512, 2048)
+FULL_ENTITY_COUNTS = (10, 1000, 10_000)
+
+EXPECTED_FASTER: Final = (
+    ("FollowPath.path_to (near)", "FollowPath.path_to_best (near, one-off)"),
+    ("FollowPath.travel_to (cached)", "FollowPath.path_to_best (far, one-off)"),
+)
+"""Pairs of cases where the first must not be slower than the second, such as a search chosen over the field."""
+
+RETIME_ATTEMPTS: Final = 2
+"""Times cases which look regressed are timed again before being reported, a single slow run is often noise."""
+
+
+@attrs.define
+class Case:
+    """A benchmark case timing one function."""
+
+    name: str
+    func: Callable[[], object]
+    setup: Callable[[], object] | None = None
+    """Called before each run outside of the timed section."""
+    min_runs: int = 3
+    max_seconds: float = 0.5
+
+
+def time_case(case: Case) -> float:
+    """Return the fastest time of one run of a case."""
+    best = float("inf")
+    total = 0.0
+    runs = 0
+    while runs < case.min_runs or total < case.max_seconds:
+        if case.setup is not None:
+            case.setup()
+        start_time = time.perf_counter()
+        case.func()
+        elapsed = time.perf_counter() - start_time
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best
+
+
+def iter_cases(registry: tcod.ecs.Registry, save_path: Path) -> Iterator[Case]:
+    """Yield the benchmark cases for a world."""
+    (player,) = registry.Q.all_of(tags=[IsPlayer])
+    target = player.components[Location]
+
+    def distance_to_target(entity: tcod.ecs.Entity) -> tuple[int, tuple[int, int]]:
+        pos = entity.components[Location]
+        return max(abs(pos.x - target.x), abs(pos.y - target.y)), pos.ij  # Positions break ties, query order varies
+
+    actor = max(
+        (e for e in registry.Q.all_of(components=[Location], tags=[IsActor]) if e is not player), key=distance_to_target
+    )
+    actor_pos = actor.components[Location]
+    map_ = actor_pos.map
+    dest = Location(actor_pos.x + 1, actor_pos.y, actor_pos.map)
+    from_actor = compute_flow_field(map_, positions_to_roots(map_, [actor_pos]))
+    i, j = np.ogrid[: from_actor.shape[0], : from_actor.shape[1]]
+    chebyshev = np.maximum(abs(i - actor_pos.y), abs(j - actor_pos.x))
+    direct = from_actor <= 3 * SEARCH_RADIUS * get_terrain_cost(map_)[actor_pos.ij]  # No longer than a diagonal
+    near_i, near_j = np.unravel_index(np.argmax(np.where(direct, chebyshev, -1)), chebyshev.shape)
+    near = Location(int(near_j), int(near_i), map_)
+    far_i, far_j = np.unravel_index(
+        np.argmax(np.where(from_actor != np.iinfo(np.int32).max, chebyshev, -1)), chebyshev.shape
+    )
+    far = Location(int(far_j), int(far_i), map_)
+    console = tcod.console.Console(80, 50)
+    np_rng = np.random.default_rng(0)
+
+    def clear_flow_fields() -> None:
+        map_.components[FlowFieldCache] = FlowFieldCache()
+
+    def clear_path_hierarchy() -> None:
+        map_.components[PathHierarchy] = PathHierarchy()
+
+    def clear_fov() -> None:
+        registry[None].components[FOVCache] = FOVCache()
+
+    def next_ticket_cycle() -> None:
+        schedule(next_ticket(registry).entity, 100)
+
+    yield Case("check_move", lambda: check_move(actor, dest, allow_dig=True))
+    yield Case("iter_entity_locations", lambda: list(iter_entity_locations(player)))
+    yield Case("get_fov", lambda: get_fov(actor), setup=clear_fov)
+    yield Case("get_fov (cached)", lambda: get_fov(actor))
+    yield Case(
+        "FollowPath.path_to_best",
+        lambda: FollowPath.path_to_best(actor, [target], goal="target"),
+        setup=clear_flow_fields,
+    )
+    yield Case("FollowPath.path_to_best (cached)", lambda: FollowPath.path_to_best(actor, [target], goal="target"))
+    yield Case("FollowPath.path_to_best (one-off)", lambda: FollowPath.path_to_best(actor, [target]))
+    yield Case("find_path", lambda: find_path(map_, actor_pos.ij, target.ij))
+    yield Case("FollowPath.path_to", lambda: FollowPath.path_to(actor, target), setup=clear_flow_fields)
+    yield Case("FollowPath.path_to (near)", lambda: FollowPath.path_to(actor, near))
+    yield Case("FollowPath.path_to_best (near, one-off)", lambda: FollowPath.path_to_best(actor, [near]))
+    yield Case("FollowPath.travel_to", lambda: FollowPath.travel_to(actor, far), setup=clear_path_hierarchy)
+    yield Case("FollowPath.travel_to (cached)", lambda: FollowPath.travel_to(actor, far))
+    yield Case("FollowPath.path_to_best (far, one-off)", lambda: FollowPath.path_to_best(actor, [far]))
+    yield Case("render_world", lambda: render_world(registry, console))
+    yield Case("save_world", lambda: save_world(registry, save_path), min_runs=1)
+    journal = SaveJournal(save_path.with_name("journal.sav"), max_deltas=sys.maxsize)
+    journal.save(registry)  # The first save is a full snapshot
+    yield Case("SaveJournal.save (delta)", lambda: journal.save(registry), setup=next_ticket_cycle, min_runs=1)
+    yield Case("load_world", lambda: load_world(save_path), min_runs=1)
+    yield Case("next_ticket", next_ticket_cycle)
+    yield Case("generate_cave_floor", lambda: generate_cave_floor(np_rng, map_.components[Shape], CaveConfig()))
+
+
+def run_benchmarks(
+    sizes: Sequence[int], entity_counts: Sequence[int], names: set[str] | None = None
+) -> dict[str, float]:
+    """Run all cases, or only the cases in `names`, and return the best time of each case by name."""
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as save_dir:
+        save_path = Path(save_dir, "bench.sav")
+        for size, entities in itertools.product(sizes, entity_counts):
+            params = f"[{size}x{size},{entities}]"
+            if names is not None and not any(name.endswith(params) for name in names):
+                continue
+            registry = new_world(seed=0, width=size, height=size, orcs=entities)
+            for case in iter_cases(registry, save_path):
+                name = f"{case.name}{params}"
+                if names is not None and name not in names:
+                    case.func()  # Run once untimed for any state later cases need, such as the save of load_world
+                    continue
+                results[name] = time_case(case)
+                print(f"{name:<56} {results[name] * 1000:>10.3f}ms", flush=True)
+    return results
+
+
+def retime_regressions(  # noqa: PLR0913
+    results: dict[str, float],
+    baseline: dict[str, float],
+    threshold: float,
+    sizes: Sequence[int],
+    entity_counts: Sequence[int],
+    attempts: int = RETIME_ATTEMPTS,
+) -> None:
+    """Time the cases slower than `threshold` times their baseline again, keeping the best time of each case."""
+    for _ in range(attempts):
+        slower = {
+            name for name, seconds in results.items() if name in baseline and seconds > baseline[name] * threshold
+        }
+        if not slower:
+            return
+        print(f"Timing {len(slower)} slower cases again.", flush=True)
+        for name, seconds in run_benchmarks(sizes, entity_counts, slower).items():
+            results[name] = min(results[name], seconds)
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """Return the names of cases which are more than `threshold` times slower than their baseline."""
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        if ratio > threshold:
+            regressions.append(name)
+            print(f"REGRESSION {name}: {baseline[name] * 1000:.3f}ms -> {seconds * 1000:.3f}ms ({ratio:.2f}x)")
+    return regressions
+
+
+def check_expected_faster(results: dict[str, float]) -> list[str]:
+    """Return the names of cases which were slower than the case listed in :any:`EXPECTED_FASTER` for them."""
+    slower_cases = []
+    for faster, slower in EXPECTED_FASTER:
+        for name, seconds in results.items():
+            case, _, params = name.partition("[")
+            other = results.get(f"{slower}[{params}")
+            if case == faster and other is not None and seconds > other:
+                slower_cases.append(name)
+                print(f"SLOWER {name}: {seconds * 1000:.3f}ms, {slower} took {other * 1000:.3f}ms")
+    return slower_cases
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Parse arguments, run the benchmarks, and compare or store the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="include the largest map sizes and entity counts")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown ratio which counts as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = FULL_MAP_SIZES if args.full else MAP_SIZES
+    entity_counts = FULL_ENTITY_COUNTS if args.full else ENTITY_COUNTS
+    results = run_benchmarks(sizes, entity_counts)
+    if check_expected_faster(results):
+        sys.exit(1)
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --save-baseline first.")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    retime_regressions(results, baseline, args.threshold, sizes, entity_counts)
+    if compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Save format benchmark.
+
+Compares the container save format with each codec against the legacy pickle and xz format::
+
+    python -m benchmarks.saving --width 2048 --height 2048 --orcs 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import lzma
+import pickle
+import tempfile
+import time
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import get_args
+
+import attrs
+import tcod.ecs
+
+from game.action_logic import do_action, simulate
+from game.actions import idle
+from game.saving import Codec, load_world, save_world
+from game.tags import IsPlayer
+from game.world_init import new_world
+
+
+@attrs.define
+class SaveResult:
+    """Timings of one save format."""
+
+    name: str
+    save_seconds: float
+    load_seconds: float
+    size: int
+
+
+def _best_time(func: Callable[[], object], runs: int) -> float:
+    """Return the fastest time of `runs` calls of `func`."""
+    best = float("inf")
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def _save_legacy(registry: tcod.ecs.Registry, path: Path) -> None:
+    """Save the way worlds were saved before the container format."""
+    path.write_bytes(lzma.compress(pickle.dumps(registry, protocol=5)))
+
+
+def run_benchmark(registry: tcod.ecs.Registry, save_dir: Path, *, level: int, runs: int) -> list[SaveResult]:
+    """Return the results of saving and loading `registry` with each format."""
+    results = []
+    legacy_path = save_dir / "legacy.sav.xz"
+    results.append(
+        SaveResult(
+            name="pickle+xz (legacy)",
+            save_seconds=_best_time(lambda: _save_legacy(registry, legacy_path), runs),
+            load_seconds=_best_time(lambda: load_world(legacy_path), runs),
+            size=legacy_path.stat().st_size,
+        )
+    )
+    for codec in get_args(Codec.__value__):
+        path = save_dir / f"{codec}.sav"
+        results.append(
+            SaveResult(
+                name=f"container {codec}",
+                save_seconds=_best_time(lambda: save_world(registry, path, codec=codec, level=level), runs),  # noqa: B023
+                load_seconds=_best_time(lambda: load_world(path), runs),  # noqa: B023
+                size=path.stat().st_size,
+            )
+        )
+        results.append(
+            SaveResult(
+                name=f"container {codec} (no mmap)",
+                save_seconds=results[-1].save_seconds,
+                load_seconds=_best_time(lambda: load_world(path, mmap=False), runs),  # noqa: B023
+                size=results[-1].size,
+            )
+        )
+    return results
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Parse arguments and print a comparison of save formats."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="world seed")
+    parser.add_argument("--width", type=int, default=512, help="map width")
+    parser.add_argument("--height", type=int, default=512, help="map height")
+    parser.add_argument("--orcs", type=int, default=1000, help="number of orcs")
+    parser.add_argument("--turns", type=int, default=10, help="player turns to simulate before saving")
+    parser.add_argument("--level", type=int, default=6, help="compression level of the container codecs")
+    parser.add_argument("--runs", type=int, default=3, help="runs of each case, the fastest is reported")
+    args = parser.parse_args(argv)
+
+    registry = new_world(seed=args.seed, width=args.width, height=args.height, orcs=args.orcs)
+    (player,) = registry.Q.all_of(tags=[IsPlayer])
+    simulate(registry)
+    for _ in range(args.turns):  # Populate the caches and layers built during play
+        do_action(player, idle)
+    with tempfile.TemporaryDirectory() as save_dir:
+        results = run_benchmark(registry, Path(save_dir), level=args.level, runs=args.runs)
+    print(f"{'format':<28} {'save':>10} {'load':>10} {'size':>12}")
+    for result in results:
+        print(
+            f"{result.name:<28} {result.save_seconds * 1000:>8.1f}ms {result.load_seconds * 1000:>8.1f}ms"
+            f" {result.size:>12,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
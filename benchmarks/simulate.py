@@ -0,0 +1,136 @@
+"""Headless simulation benchmark.
+
+Runs the full simulation without a window and reports its throughput::
+
+    python -m benchmarks.simulate --ticks 10000 --width 256 --height 256 --orcs 100 --kobolds 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections.abc import Sequence
+
+import attrs
+
+from game.action_logic import SimulationStats, do_action, simulate
+from game.actions import idle
+from game.pathfinding import PathStats, PathStrategy
+from game.tags import IsPlayer
+from game.timesys import QueueStats, Tick, Ticket, get_queue_stats
+from game.world_init import new_world
+
+
+@attrs.define
+class SimulationReport:
+    """Results of a simulation benchmark."""
+
+    generate_seconds: float
+    ticks: int
+    seconds: float
+    stats: SimulationStats
+    queue: QueueStats
+    paths: PathStats
+
+    def as_dict(self) -> dict[str, object]:
+        """Return this report as JSON compatible data."""
+        return {
+            "generate_seconds": self.generate_seconds,
+            "ticks": self.ticks,
+            "seconds": self.seconds,
+            "ticks_per_second": self.ticks / self.seconds if self.seconds else 0.0,
+            "actions": self.stats.actions,
+            "actions_per_second": self.stats.actions / self.seconds if self.seconds else 0.0,
+            "queue": {**attrs.asdict(self.queue), "stale_ratio": self.queue.stale_ratio},
+            "paths": {
+                strategy.value: {
+                    "requests": self.paths.requests[strategy],
+                    "expanded": self.paths.expanded[strategy],
+                    "expanded_per_request": self.paths.expanded_per_request(strategy),
+                }
+                for strategy in PathStrategy
+            },
+            "ai": {
+                name: {"calls": calls, "seconds": self.stats.seconds[name]}
+                for name, calls in self.stats.calls.most_common()
+            },
+        }
+
+
+def run_simulation(  # noqa: PLR0913
+    *,
+    ticks: int,
+    seed: int | None = 0,
+    width: int = 128,
+    height: int = 128,
+    orcs: int | None = None,
+    kobolds: int = 4,
+) -> SimulationReport:
+    """Generate a world and simulate it for at least `ticks` ticks."""
+    start_time = time.perf_counter()
+    registry = new_world(seed=seed, width=width, height=height, orcs=orcs, kobolds=kobolds)
+    generate_seconds = time.perf_counter() - start_time
+
+    stats = registry[None].components[SimulationStats] = SimulationStats()
+    paths = registry[None].components[PathStats] = PathStats()
+    (player,) = registry.Q.all_of(tags=[IsPlayer])
+    start_time = time.perf_counter()
+    simulate(registry)
+    start_tick = registry[None].components[Tick]
+    while registry[None].components[Tick] - start_tick < ticks and Ticket in player.components:
+        do_action(player, idle)
+    seconds = time.perf_counter() - start_time
+    return SimulationReport(
+        generate_seconds=generate_seconds,
+        ticks=registry[None].components[Tick] - start_tick,
+        seconds=seconds,
+        stats=stats,
+        queue=get_queue_stats(registry),
+        paths=paths,
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Parse arguments and print a benchmark report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", type=int, default=10_000, help="number of ticks to simulate")
+    parser.add_argument("--seed", type=int, default=0, help="world seed")
+    parser.add_argument("--width", type=int, default=128, help="map width")
+    parser.add_argument("--height", type=int, default=128, help="map height")
+    parser.add_argument("--orcs", type=int, default=None, help="number of orcs, default scales with the map size")
+    parser.add_argument("--kobolds", type=int, default=4, help="number of kobolds")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_simulation(
+        ticks=args.ticks,
+        seed=args.seed,
+        width=args.width,
+        height=args.height,
+        orcs=args.orcs,
+        kobolds=args.kobolds,
+    )
+    data = report.as_dict()
+    if args.json:
+        print(json.dumps(data, indent=2))
+        return
+    print(f"World generated in {report.generate_seconds:.3f}s")
+    print(f"Simulated {report.ticks} ticks in {report.seconds:.3f}s")
+    print(f"{data['ticks_per_second']:.1f} ticks/sec, {data['actions_per_second']:.1f} actions/sec")
+    print(
+        f"Turn queue: {report.queue.size} tickets, {report.queue.stale_ratio:.1%} stale,"
+        f" {report.queue.cancelled} cancelled"
+    )
+    for strategy in PathStrategy:
+        print(
+            f"Paths {strategy.value:<8} {report.paths.requests[strategy]:>8} requests"
+            f" {report.paths.expanded_per_request(strategy):>10.1f} nodes/request"
+        )
+    for name, calls in report.stats.calls.most_common():
+        seconds = report.stats.seconds[name]
+        print(f"  {name:<20} {calls:>8} calls {seconds:>8.3f}s {seconds / calls * 1_000_000:>8.1f}us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,25 @@
 import tcod.ecs
 import tcod.tileset
 
+from game.frame_stats import FrameStats  # noqa: TC001
+from game.pregen import Pregenerator  # noqa: TC001
 from game.state import State  # noqa: TC001
 
 context: tcod.context.Context
 """Active tcod context."""
 
+frame_stats: FrameStats
+"""Frame times of the main loop."""
+
+pregen: Pregenerator
+"""Background generator of new worlds."""
+
 registry: tcod.ecs.Registry
 """Active ECS registry."""
 
+simulation_budget: float
+"""Seconds per frame which may be spent simulating the world."""
+
 state: State
 """Active game state."""
 
@@ -3,7 +3,10 @@
 from __future__ import annotations
 
 import logging
+import time
+from collections import Counter, defaultdict
 
+import attrs
 import tcod.ecs
 
 from game.action import Action, Impossible, Success
@@ -15,8 +18,12 @@
 logger = logging.getLogger(__name__)
 
 
-def do_action(actor: tcod.ecs.Entity, action: Action) -> StateResult:
-    """Apply an action and its side effects."""
+def do_action(actor: tcod.ecs.Entity, action: Action, *, blocking: bool = True) -> StateResult:
+    """Apply an action and its side effects.
+
+    After a player action the world is simulated until a player is active again.
+    If `blocking` is False then the world is left for the caller to resume with :any:`simulate`.
+    """
     ticket = next_ticket(actor.registry)
     assert ticket.entity is actor, sorted(actor.registry[None].components[TurnQueue])
     result = action(actor)
@@ -37,16 +44,56 @@ def do_action(actor: tcod.ecs.Entity, action: Action) -> StateResult:
         case _:
             raise AssertionError(result)
 
-    if ticket.entity.components.get(AI) is None:
+    if blocking and ticket.entity.components.get(AI) is None:
         simulate(actor.registry)
     return None
 
 
-def simulate(registry: tcod.ecs.Registry) -> None:
-    """Simulate the world until a player entity is active."""
+@attrs.define
+class SimulationStats:
+    """AI timings collected by :any:`simulate` while this is a component of the global entity."""
+
+    calls: Counter[str] = attrs.field(factory=Counter)
+    """Number of actions performed by each AI class."""
+    seconds: defaultdict[str, float] = attrs.field(factory=lambda: defaultdict(float))
+    """Total time spent by each AI class."""
+
+    @property
+    def actions(self) -> int:
+        """Total number of AI actions performed."""
+        return self.calls.total()
+
+
+def is_player_turn(registry: tcod.ecs.Registry) -> bool:
+    """Return True if a player entity is the next to act."""
+    queue = registry[None].components.get(TurnQueue)
+    return bool(queue) and IsPlayer in next_ticket(registry).entity.tags
+
+
+def simulate(registry: tcod.ecs.Registry, budget: float | None = None) -> bool:
+    """Simulate the world until a player entity is active.
+
+    If `budget` is given then simulation stops once that many seconds have passed and can be resumed by calling this
+    again.
+    At least one action is performed per call and the world is always left between two actions.
+
+    Returns True if the simulation is waiting on a player, or False if the budget ran out first.
+    """
+    deadline = None if budget is None else time.perf_counter() + budget
+    stats = registry[None].components.get(SimulationStats)
     while registry.Q.all_of(components=[Ticket], tags=[IsPlayer]):
         ticket = next_ticket(registry)
         ai = ticket.entity.components.get(AI)
         if ai is None:
-            return
-        do_action(ticket.entity, ai)
+            return True
+        if stats is None:
+            do_action(ticket.entity, ai)
+        else:
+            start_time = time.perf_counter()
+            do_action(ticket.entity, ai)
+            ai_name = type(ai).__name__
+            stats.calls[ai_name] += 1
+            stats.seconds[ai_name] += time.perf_counter() - start_time
+        if deadline is not None and time.perf_counter() >= deadline:
+            return is_player_turn(registry)
+    return True
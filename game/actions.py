@@ -3,9 +3,9 @@
 from __future__ import annotations
 
 from collections import deque
-from collections.abc import Iterable
+from collections.abc import Hashable, Iterable
 from random import Random
-from typing import Self
+from typing import Any, Final, Self
 
 import attrs
 import numpy as np
@@ -16,12 +16,47 @@
 from game.action import Action, ActionResult, Impossible, Success
 from game.actor_logic import actor_at, get_fov
 from game.combat import attack_obj
-from game.components import Gold, Location, RoomTypeLayer, Shape, TilesLayer
+from game.components import (
+    Gold,
+    GoldVersion,
+    Location,
+    OccupancyLayer,
+    RoomTypeLayer,
+    Shape,
+    SightRadius,
+    TerrainVersion,
+    mark_changed,
+    mark_tile_changed,
+)
 from game.faction import get_enemy_factions, is_enemy
-from game.room import RoomType
+from game.path_hierarchy import find_waypoints, refine_segment
+from game.pathfinding import (
+    PathStrategy,
+    compute_flow_field,
+    descend,
+    find_path,
+    get_flow_field,
+    get_terrain_cost,
+    is_flow_field_cached,
+    positions_to_roots,
+    record_path_stats,
+)
+from game.rendering import update_tile_glyph
+from game.room import RoomType  # noqa: TC001
+from game.spatial import EntityKind, get_spatial_index
+from game.stockpile import get_stockpile, store_gold, update_stockpile_slot
 from game.tags import FacetOf, InStorage, IsActor, IsItem
-from game.tile import TileDB
-from game.travel import check_move, force_move, in_bounds, is_multi_tile, iter_entity_locations
+from game.timesys import Tick
+from game.travel import check_move, force_move, in_bounds, iter_entity_locations
+
+TRAVEL_DISTANCE: Final = 64
+"""Distance in tiles beyond which :any:`FollowPath.path_to` uses the hierarchical pathfinder."""
+
+SEARCH_RADIUS: Final = 16
+"""Distance within which :any:`FollowPath.path_to` always searches with A*, even if a flow field is cached."""
+
+GATHER_REPLAN_TICKS: Final = 1000
+"""Default ticks after which :any:`MinionAI` replans its gathering path even if nothing changed."""
 
 
 def idle(_actor: tcod.ecs.Entity) -> Success:
@@ -54,26 +89,34 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         if cost is None:
             return Impossible("Blocked.")
         force_move(actor, dest)
-        map_room_types = dest.map.components[RoomTypeLayer]
-        for pos in iter_entity_locations(actor):
-            for item in actor.registry.Q.all_of(components=[Gold], tags=[IsItem, pos]).none_of(tags=[InStorage]):
-                actor.components.setdefault(Gold, 0)
-                actor.components[Gold] += item.components[Gold]
-                item.clear()
-            if (
-                actor.components.get(Gold)
-                and map_room_types[pos.ij] == RoomType.Treasury
-                and not actor.registry.Q.all_of(components=[Gold], tags=[pos, InStorage])
-            ):
-                obj = actor.registry["gold"].instantiate()
-                obj.components[Location] = pos
-                obj.components[Gold] = actor.components[Gold]
-                actor.components[Gold] = 0
-                obj.tags.add(InStorage)
-
+        _exchange_gold(actor)
         return Success()
 
 
+def _exchange_gold(actor: tcod.ecs.Entity) -> None:
+    """Pick up loose gold under an actor and deposit carried gold into a free treasury tile."""
+    map_ = actor.components[Location].map
+    index = get_spatial_index(map_)
+    stockpile = get_stockpile(map_)
+    for pos in iter_entity_locations(actor):
+        for item in index.at(pos.ij, EntityKind.Item):
+            if Gold not in item.components or InStorage in item.tags:
+                continue
+            actor.components.setdefault(Gold, 0)
+            actor.components[Gold] += item.components[Gold]
+            item.clear()
+            map_.components[GoldVersion] = map_.components.get(GoldVersion, 0) + 1
+            mark_changed(map_)
+        if actor.components.get(Gold) and stockpile.free[pos.ij]:
+            obj = actor.registry["gold"].instantiate()
+            obj.components[Location] = pos
+            obj.components[Gold] = actor.components[Gold]
+            actor.components[Gold] = 0
+            store_gold(obj)
+            map_.components[GoldVersion] = map_.components.get(GoldVersion, 0) + 1
+            mark_changed(map_)
+
+
 def walk_random(actor: tcod.ecs.Entity) -> ActionResult:
     """Walk in a random direction."""
     rng = actor.registry[None].components[Random]
@@ -103,71 +146,229 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         room_array = actor.components[Location].map.components[RoomTypeLayer]
         for pos in iter_entity_locations(actor):
             room_array[pos.ij] = self.set_room
+            mark_tile_changed(pos)
+            update_stockpile_slot(pos)
+            update_tile_glyph(pos)
         return Success()
 
 
-@attrs.define
-class FollowPath:
-    """Follow path action."""
+def _no_path() -> NDArray[np.intc]:
+    """Return an empty path array."""
+    return np.zeros((0, 2), dtype=np.intc)
+
+
+def _restore_fields(obj: attrs.AttrsInstance, state: dict[str, Any] | tuple[None, dict[str, Any]]) -> dict[str, Any]:
+    """Restore the fields of an unpickled action and return the pickled fields.
 
-    path: deque[tuple[int, int]]
+    Fields which did not exist when the action was saved get their defaults.
+    """
+    values = state[1] if isinstance(state, tuple) else state  # Older saves pickled the fields as a dict
+    for field in attrs.fields(type(obj)):
+        if field.name in values:
+            value = values[field.name]
+        elif isinstance(field.default, attrs.Factory):  # type: ignore[arg-type]
+            value = field.default.factory()
+        else:
+            value = field.default
+        object.__setattr__(obj, field.name, value)
+    return values
+
+
+@attrs.define(eq=False)
+class FollowPath:
+    """Follow path action.
+
+    Long paths are followed through `waypoints`, the tiles to each waypoint are only found once it is next.
+    When the next tile is blocked the actor waits for up to `max_wait` turns, then detours around the blockage back
+    onto the path within `repair_radius` tiles, the path is only abandoned if there is no such detour.
+    """
+
+    path: NDArray[np.intc]
+    """Remaining tiles of the path as an array of ij rows."""
+    waypoints: NDArray[np.intc] = attrs.field(factory=_no_path)
+    """Remaining ij waypoints of a hierarchical path after the end of `path`."""
+    max_wait: int = 2
+    """Turns to wait for a blocked tile to clear before detouring."""
+    repair_radius: int = 8
+    """Distance from the actor a detour may go."""
+    blocked_turns: int = 0
+    """Turns waited so far on the current blockage."""
+
+    def __setstate__(self, state: dict[str, Any] | tuple[None, dict[str, Any]]) -> None:
+        """Restore a pickled path, older saves stored the path as a deque of xy tuples."""
+        _restore_fields(self, state)
+        if isinstance(self.path, deque):
+            self.path = np.array([(y, x) for x, y in self.path], dtype=np.intc).reshape(-1, 2)
 
     @classmethod
     def from_ij_array(cls, array: NDArray[np.integer]) -> Self:
         """Initialize path from Numpy array."""
-        return cls(deque((yx.item(1), yx.item(0)) for yx in array))
+        return cls(np.asarray(array, dtype=np.intc).reshape(-1, 2))
 
     @classmethod
-    def path_to_best(cls, actor: tcod.ecs.Entity, positions: Iterable[Location]) -> Self:
-        """Initialize path to the best position of an iterable."""
-        pf = tcod.path.Pathfinder(_get_graph(actor))
-        for pos in positions:
-            pf.add_root(pos.ij)
+    def from_flow_field(cls, actor: tcod.ecs.Entity, goal: Hashable, roots: NDArray[np.bool_]) -> Self:
+        """Initialize path by descending the shared flow field of a goal."""
+        actor_pos = actor.components[Location]
+        record_path_stats(actor.registry, PathStrategy.Dijkstra, requests=1, expanded=0)  # Counted by the field
+        return cls.from_ij_array(descend(get_flow_field(actor_pos.map, goal, roots), actor_pos))
 
-        return cls.from_ij_array(pf.path_from(actor.components[Location].ij)[1:])
+    @classmethod
+    def path_to_best(cls, actor: tcod.ecs.Entity, positions: Iterable[Location], goal: Hashable | None = None) -> Self:
+        """Initialize path to the best position of an iterable.
+
+        Actors with the same `goal` share a cached flow field.
+        Without a `goal` the positions are taken to be a one-off target set and the field is not cached.
+        """
+        actor_pos = actor.components[Location]
+        roots = positions_to_roots(actor_pos.map, positions)
+        if goal is not None:
+            return cls.from_flow_field(actor, goal, roots)
+        record_path_stats(actor.registry, PathStrategy.Dijkstra, requests=1, expanded=0)  # Counted by the field
+        return cls.from_ij_array(descend(compute_flow_field(actor_pos.map, roots), actor_pos))
 
     @classmethod
-    def path_to(cls, actor: tcod.ecs.Entity, target: Location | tcod.ecs.Entity) -> Self:
-        """Initialize path to a position or actor."""
+    def path_to_roots(cls, actor: tcod.ecs.Entity, goal: Hashable, roots: NDArray[np.bool_]) -> Self:
+        """Initialize path to the roots of a shared goal, such as from :any:`GatherTreasureAI`.
+
+        If the nearest root is further than :any:`TRAVEL_DISTANCE` and the flow field of `goal` is not cached then the
+        hierarchical pathfinder is used when it finds a path, otherwise the path descends the flow field of `goal`.
+        """
+        actor_pos = actor.components[Location]
+        map_ = actor_pos.map
+        root_i, root_j = np.nonzero(roots)
+        if root_i.size and not is_flow_field_cached(map_, goal, roots):
+            distance = np.maximum(abs(root_i - actor_pos.y), abs(root_j - actor_pos.x))
+            nearest = int(distance.argmin())
+            if distance[nearest] > TRAVEL_DISTANCE:
+                path = cls.travel_to(actor, Location(int(root_j[nearest]), int(root_i[nearest]), map_))
+                if path is not None:
+                    return path
+        return cls.from_flow_field(actor, goal, roots)
+
+    @classmethod
+    def travel_to(cls, actor: tcod.ecs.Entity, dest: Location) -> Self | None:
+        """Initialize a hierarchical path to a distant position, or return None if the hierarchy found no path."""
+        actor_pos = actor.components[Location]
+        waypoints = find_waypoints(actor_pos.map, actor_pos.ij, dest.ij)
+        if waypoints is None:
+            return None
+        path = cls(_no_path(), np.array(waypoints, dtype=np.intc))
+        path.refine_next(actor)
+        return path
+
+    @classmethod
+    def path_to(
+        cls,
+        actor: tcod.ecs.Entity,
+        target: Location | tcod.ecs.Entity,
+        strategy: PathStrategy = PathStrategy.AStar,
+    ) -> Self:
+        """Initialize path to a position or actor.
+
+        Targets further than :any:`TRAVEL_DISTANCE` use the hierarchical pathfinder when it finds a path.
+        With :any:`PathStrategy.AStar` nearer targets are found by :any:`find_path`, except for targets further than
+        :any:`SEARCH_RADIUS` whose shared flow field is already cached, descending that is cheaper than any search.
+        Otherwise, or when the search finds no path within its budget, the path descends the flow field of the target
+        as with :any:`PathStrategy.Dijkstra`.
+        """
+        actor_pos = actor.components[Location]
+        map_ = actor_pos.map
         if isinstance(target, Location):
-            return cls.path_to_best(actor, [target])
-        return cls.path_to_best(actor, iter_entity_locations(target))
+            positions, goal = [target], None
+        else:
+            positions, goal = list(iter_entity_locations(target)), ("entity", target)
+        nearest = min(positions, key=lambda pos: max(abs(pos.x - actor_pos.x), abs(pos.y - actor_pos.y)))
+        if nearest.map is map_:
+            distance = max(abs(nearest.x - actor_pos.x), abs(nearest.y - actor_pos.y))
+            if distance > TRAVEL_DISTANCE and (path := cls.travel_to(actor, nearest)) is not None:
+                return path
+            if strategy is PathStrategy.AStar and (
+                distance <= SEARCH_RADIUS
+                or goal is None
+                or not is_flow_field_cached(map_, goal, positions_to_roots(map_, positions))
+            ):
+                ij_path = find_path(map_, actor_pos.ij, nearest.ij)
+                if ij_path is not None:
+                    return cls(ij_path)
+        return cls.path_to_best(actor, positions, goal=goal)
+
+    @property
+    def destination(self) -> tuple[int, int] | None:
+        """The ij position this path ends at, or None if the path is empty."""
+        end = self.waypoints if len(self.waypoints) else self.path
+        if not len(end):
+            return None
+        i, j = end[-1].tolist()
+        return i, j
+
+    def refine_next(self, actor: tcod.ecs.Entity) -> None:
+        """Find the tiles to the next waypoint."""
+        actor_pos = actor.components[Location]
+        (i, j), self.waypoints = self.waypoints[0].tolist(), self.waypoints[1:]
+        self.path = refine_segment(actor_pos.map, actor_pos.ij, (i, j))
+
+    def repair(self, actor: tcod.ecs.Entity) -> bool:
+        """Replace the blocked start of the path with a detour back onto it, return False if there is no detour.
+
+        The detour avoids all occupied tiles and is limited to `repair_radius` tiles from the actor.
+        """
+        actor_pos = actor.components[Location]
+        map_ = actor_pos.map
+        i, j = actor_pos.ij
+        i0, j0 = max(0, i - self.repair_radius), max(0, j - self.repair_radius)
+        offset = np.array((i0, j0), dtype=np.intc)
+        window = slice(i0, i + self.repair_radius + 1), slice(j0, j + self.repair_radius + 1)
+        cost = get_terrain_cost(map_)[window].copy()
+        cost[map_.components[OccupancyLayer][window] != 0] = 0
+        local = self.path - offset
+        rejoins = np.flatnonzero(np.all((local >= 0) & (local < cost.shape), axis=1))
+        rejoins = rejoins[(rejoins > 0) & (cost[tuple(local[rejoins].T)] != 0)]  # Never the blocked tile itself
+        if not rejoins.size:
+            return False
+        detour = tcod.path.path2d(
+            cost, start_points=[(i - i0, j - j0)], end_points=local[rejoins].tolist(), cardinal=2, diagonal=3
+        )
+        if not len(detour):
+            return False
+        rejoin = rejoins[np.all(local[rejoins] == detour[-1], axis=1)].max()
+        self.path = np.concatenate([detour[1:] + offset, self.path[rejoin + 1 :]]).astype(np.intc)
+        return True
+
+    def _step(self, actor: tcod.ecs.Entity) -> ActionResult:
+        """Bump towards the next tile of the path."""
+        dest_i, dest_j = self.path[0].tolist()
+        actor_pos = actor.components[Location]
+        if max(abs(dest_i - actor_pos.y), abs(dest_j - actor_pos.x)) != 1:
+            return Impossible("Off the path.")
+        result = Bump((dest_j - actor_pos.x, dest_i - actor_pos.y), allow_dig=True)(actor)
+        if isinstance(result, Success):
+            self.blocked_turns = 0
+            if actor.components[Location].ij == (dest_i, dest_j):
+                self.path = self.path[1:]
+        return result
 
     def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         """Take one step on path."""
-        if not self.path:
+        if not len(self.path) and len(self.waypoints):
+            self.refine_next(actor)
+        if not len(self.path):
+            self.waypoints = _no_path()
             return Impossible("End of path reached.")
-        dest_x, dest_y = self.path[0]
-        actor_pos = actor.components[Location]
-        result = Bump((dest_x - actor_pos.x, dest_y - actor_pos.y), allow_dig=True)(actor)
-        actor_pos = actor.components[Location]
-        if isinstance(result, Success) and actor_pos.x == dest_x and actor_pos.y == dest_y:
-            self.path.popleft()
-        if isinstance(result, Impossible):
-            self.path.clear()
+        result = self._step(actor)
+        if isinstance(result, Success):
+            return result
+        if result.msg == "Blocked." and self.blocked_turns < self.max_wait:
+            self.blocked_turns += 1
+            return Success()  # Wait for the tile to clear
+        self.blocked_turns = 0
+        if self.repair(actor) and isinstance(result := self._step(actor), Success):
+            return result
+        self.path = self.waypoints = _no_path()
         return result
 
     def __bool__(self) -> bool:
         """Falsy after path is fully traversed."""
-        return bool(self.path)
-
-
-def _get_graph(actor: tcod.ecs.Entity) -> tcod.path.SimpleGraph:
-    """Return the pathfinding graph for an actor."""
-    map_ = actor.components[Location].map
-    tile_db = actor.registry[None].components[TileDB]
-    cost = tile_db.data["move_cost"][map_.components[TilesLayer]]
-    if not is_multi_tile(actor):
-        for e in actor.registry.Q.all_of(components=[Location], tags=[IsActor]).none_of(
-            relations=[(..., FacetOf, None)]
-        ):
-            cost[e.components[Location].ij] += 10
-    else:
-        for e in actor.registry.Q.all_of(components=[Location]).none_of(
-            relations=[(FacetOf, actor.registry.Q.all_of(tags=[IsActor]))]
-        ):
-            cost[e.components[Location].ij] += 10
-    return tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+        return bool(len(self.path) or len(self.waypoints))
 
 
 @attrs.define
@@ -176,29 +377,42 @@ class GatherTreasureAI:
 
     sub_action: Action | None = None
 
+    def _get_goal(self, actor: tcod.ecs.Entity) -> tuple[str, NDArray[np.bool_]] | None:
+        """Return the flow field goal and roots this actor should follow, if any."""
+        map_ = actor.components[Location].map
+        if actor.components.get(Gold):  # Carry back gold.
+            stockpile = get_stockpile(map_)
+            if not stockpile.free_count:
+                return None
+            return "free treasury", stockpile.free
+        # Find gold.
+        roots = positions_to_roots(
+            map_,
+            (
+                e.components[Location]
+                for e in actor.registry.Q.all_of([Gold, Location], tags=[IsItem]).none_of(tags=[InStorage])
+            ),
+        )
+        return "loose gold", roots
+
+    def is_destination_valid(self, actor: tcod.ecs.Entity) -> bool:
+        """Return True if the current path still ends at loose gold, or at a free treasury tile when carrying gold."""
+        if not isinstance(self.sub_action, FollowPath) or (destination := self.sub_action.destination) is None:
+            return False
+        map_ = actor.components[Location].map
+        i, j = destination
+        if actor.components.get(Gold):
+            return bool(get_stockpile(map_).free[i, j])
+        items = get_spatial_index(map_).at((i, j), EntityKind.Item)
+        return any(Gold in item.components and InStorage not in item.tags for item in items)
+
     def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         """Move to gather gold."""
         if self.sub_action:
             return self.sub_action(actor)
-        actor_pos = actor.components[Location]
-        if actor.components.get(Gold):  # Carry back gold.
-            goal = actor_pos.map.components[RoomTypeLayer] == RoomType.Treasury
-            if goal.any():
-                pf = tcod.path.Pathfinder(_get_graph(actor))
-                for i, j in np.argwhere(goal):
-                    i = int(i)  # noqa: PLW2901
-                    j = int(j)  # noqa: PLW2901
-                    if actor.registry.Q.all_of(components=[Gold], tags=[InStorage, Location(j, i, actor_pos.map)]):
-                        continue
-                    pf.add_root((i, j))
-                self.sub_action = FollowPath.from_ij_array(pf.path_from(actor_pos.ij)[1:])
-                if self.sub_action:
-                    return self.sub_action(actor)
-        else:  # Find gold.
-            pf = tcod.path.Pathfinder(_get_graph(actor))
-            for e in actor.registry.Q.all_of([Gold, Location], tags=[IsItem]).none_of(tags=[InStorage]):
-                pf.add_root(e.components[Location].ij)
-            self.sub_action = FollowPath.from_ij_array(pf.path_from(actor_pos.ij)[1:])
+        goal = self._get_goal(actor)
+        if goal is not None:
+            self.sub_action = FollowPath.path_to_roots(actor, *goal)
             if self.sub_action:
                 return self.sub_action(actor)
 
@@ -207,7 +421,10 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
 
 @attrs.define()
 class RallyToEntity:
-    """Rally to a target entity."""
+    """Rally to a target entity.
+
+    A distant target is approached along a hierarchical path which is only replanned once its last waypoint is next.
+    """
 
     target: tcod.ecs.Entity
 
@@ -215,10 +432,12 @@ class RallyToEntity:
 
     def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         """Move adjacent to the target."""
-        pf = tcod.path.Pathfinder(_get_graph(actor))
-        for pos in iter_entity_locations(self.target):
-            pf.add_root(pos.ij)
-        self.sub_action = FollowPath.from_ij_array(pf.path_from(actor.components[Location].ij)[1:-1])
+        if isinstance(self.sub_action, FollowPath) and len(self.sub_action.waypoints):
+            return self.sub_action(actor)
+        path = FollowPath.path_to(actor, self.target)
+        if len(path.path) and not len(path.waypoints):
+            path.path = path.path[:-1]  # Stop adjacent to the target.
+        self.sub_action = path
         if self.sub_action:
             return self.sub_action(actor)
 
@@ -227,7 +446,10 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
 
 @attrs.define()
 class ExitMap:
-    """Exit the map."""
+    """Exit the map.
+
+    The path to the edge of the map is kept until it ends or is blocked.
+    """
 
     sub_action: Action | None = None
 
@@ -240,15 +462,10 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
             actor.clear()
             return Success()
 
-        tile_db = actor.registry[None].components[TileDB]
-
-        edge = tile_db.data["move_cost"][map_.components[TilesLayer]] != 0
-        edge[1:-1, 1:-1] = False
-        pf = tcod.path.Pathfinder(_get_graph(actor))
-        for i, j in np.argwhere(edge):
-            pf.add_root((i, j))
-
-        self.sub_action = FollowPath.from_ij_array(pf.path_from(actor.components[Location].ij)[1:])
+        if not self.sub_action:
+            edge = get_terrain_cost(map_) != 0
+            edge[1:-1, 1:-1] = False
+            self.sub_action = FollowPath.path_to_roots(actor, "map exit", edge)
         return self.sub_action(actor)
 
 
@@ -273,35 +490,102 @@ def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         valid_targets_pos = []
         for target in targets:
             target_pos = target.components[Location]
-            if not visible[target_pos.ij]:
+            if target_pos.ij not in visible:
                 continue
             valid_targets_pos.append(target_pos)
-        if valid_targets_pos:
+        if len(valid_targets_pos) == 1:
+            self.sub_action = FollowPath.path_to(actor, valid_targets_pos[0])
+        elif valid_targets_pos:
             self.sub_action = FollowPath.path_to_best(actor, valid_targets_pos)
         if self.sub_action:
             return self.sub_action(actor)
         return Impossible("no targets")  # Wait for targets.
 
 
+def _enemy_in_sight_range(actor: tcod.ecs.Entity) -> bool:
+    """Return True if an enemy is within the sight radius of an actor, ignoring whether it is visible."""
+    pos = actor.components[Location]
+    radius = actor.components.get(SightRadius, 0)
+    if radius:
+        region = slice(pos.y - radius, pos.y + radius + 1), slice(pos.x - radius, pos.x + radius + 1)
+    else:
+        height, width = pos.map.components[Shape]
+        region = slice(0, height), slice(0, width)
+    for entity in get_spatial_index(pos.map).in_region(region):
+        owner = entity.relation_tag.get(FacetOf, entity)
+        if IsActor in owner.tags and is_enemy(actor, owner):
+            return True
+    return False
+
+
 @attrs.define()
 class MinionAI:
-    """General minion AI."""
+    """General minion AI.
+
+    Gathering is kept between turns so that the minion usually only takes the next step of its path.
+    The path is replanned every `gather_interval` ticks, when the terrain of the map changes, or when gold on the map
+    changes and the path no longer leads to gold or to a free treasury tile.
+    A minion which found nothing to gather wanders until one of those happens.
+    Hostile behavior is only considered while an enemy is within sight range, found from the spatial index.
+    """
 
     sub_action: Action | None = None
+    gather: GatherTreasureAI = attrs.field(factory=GatherTreasureAI)
+    """Persistent gathering behavior."""
+    gather_interval: int = GATHER_REPLAN_TICKS
+    """Ticks after which the gathering path is replanned regardless of events."""
+    gather_replan_tick: int = 0
+    """Tick at which the gathering path will be replanned."""
+    terrain_version: int = 0
+    """TerrainVersion of the map when last checked."""
+    gold_version: int = 0
+    """GoldVersion of the map when last checked."""
+    gather_stalled: bool = False
+    """True if the last gathering plan found nothing, no plan is attempted again until it is due or invalidated."""
+
+    def __setstate__(self, state: dict[str, Any] | tuple[None, dict[str, Any]]) -> None:
+        """Restore a pickled AI, older saves only had `sub_action` which may hold the gathering behavior."""
+        if "gather" not in _restore_fields(self, state) and isinstance(self.sub_action, GatherTreasureAI):
+            self.gather = self.sub_action  # Keep following the saved path
+
+    def _gather(self, actor: tcod.ecs.Entity) -> ActionResult:
+        """Continue gathering, a new path is only planned once the current one is done, due or invalidated."""
+        tick = actor.registry[None].components.get(Tick, 0)
+        map_ = actor.components[Location].map
+        terrain_version = map_.components.get(TerrainVersion, 0)
+        gold_version = map_.components.get(GoldVersion, 0)
+        if (
+            tick >= self.gather_replan_tick
+            or terrain_version != self.terrain_version
+            or (gold_version != self.gold_version and not self.gather.is_destination_valid(actor))
+        ):
+            self.gather.sub_action = None
+            self.gather_stalled = False
+        self.terrain_version = terrain_version
+        self.gold_version = gold_version
+        if self.gather_stalled:
+            return walk_random(actor)  # Nothing to gather until something changes
+        if self.gather.sub_action:
+            return self.gather(actor)
+        self.gather_replan_tick = tick + self.gather_interval
+        result = self.gather(actor)
+        self.gather_stalled = not self.gather.sub_action
+        return result
 
     def __call__(self, actor: tcod.ecs.Entity) -> ActionResult:
         """Defer to the most appropriate action."""
-        action: Action = HostileAI()
-        if result := action(actor):
-            self.sub_action = action
-            return result
-
-        action = GatherTreasureAI()
-        if result := action(actor):
-            self.sub_action = action
+        if _enemy_in_sight_range(actor):
+            action: Action = HostileAI()
+            if result := action(actor):
+                self.sub_action = action
+                self.gather.sub_action = None  # Left the path to fight
+                return result
+
+        if result := self._gather(actor):
+            self.sub_action = self.gather
             return result
 
-        if self.sub_action:
+        if self.sub_action is not None and self.sub_action is not self.gather:
             return self.sub_action(actor)
 
         return Impossible("nothing to do")
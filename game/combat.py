@@ -7,8 +7,9 @@
 import tcod.ecs
 
 from game.action import ActionResult, Success
-from game.components import AI, HP, Graphic, Str
-from game.tags import IsActor
+from game.components import AI, HP, Graphic, Location, Str, add_occupant, mark_changed
+from game.spatial import reindex
+from game.tags import FacetOf, IsActor
 from game.timesys import Ticket
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,7 @@ def attack_obj(actor: tcod.ecs.Entity, target: tcod.ecs.Entity) -> ActionResult:
     logger.debug("%s attacks %s", actor, target)
     if HP in target.components:
         target.components[HP] -= actor.components[Str]
+        mark_changed(target)
         if target.components[HP] <= 0:
             kill(target)
     return Success()
@@ -26,7 +28,12 @@ def attack_obj(actor: tcod.ecs.Entity, target: tcod.ecs.Entity) -> ActionResult:
 
 def kill(actor: tcod.ecs.Entity) -> None:
     """Kill an entity instantly."""
+    for obstacle in (actor, *actor.registry.Q.all_of(components=[Location], relations=[(FacetOf, actor)])):
+        if Location in obstacle.components:
+            add_occupant(obstacle.components[Location], -1)
     actor.tags.remove(IsActor)
+    reindex(actor)
+    mark_changed(actor)
     actor.components[Graphic] = Graphic(ord("%"), (0x80, 0, 0))
     actor.components.pop(Ticket, None)
     actor.components.pop(AI, None)
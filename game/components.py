@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+from concurrent.futures import Future
 from typing import Final, NamedTuple, Self
 
 import attrs
@@ -11,6 +12,7 @@
 from numpy.typing import NDArray
 
 from game.action import Action
+from game.tags import FacetOf, IsActor
 
 
 @attrs.define(frozen=True)
@@ -61,6 +63,33 @@ class Shape(NamedTuple):
 RoomTypeLayer: Final = ("RoomTypeLayer", NDArray[np.uint8])
 """Array of room type indexes."""
 
+TerrainVersion: Final = ("TerrainVersion", int)
+"""Incremented whenever the TilesLayer of a map is modified."""
+
+GoldVersion: Final = ("GoldVersion", int)
+"""Incremented whenever gold on a map is picked up or stored."""
+
+MoveCostLayer: Final = ("MoveCostLayer", NDArray[np.int32])
+"""Terrain movement cost of each tile, zero for impassable tiles."""
+
+OccupancyLayer: Final = ("OccupancyLayer", NDArray[np.int32])
+"""Number of actors and actor facets on each tile."""
+
+PathCostLayer: Final = ("PathCostLayer", NDArray[np.int32])
+"""Movement cost of each tile with a penalty for every occupant, used to path around other actors."""
+
+OCCUPIED_PENALTY: Final = 10
+"""Path cost added for each occupant of a tile."""
+
+TransparencyLayer: Final = ("TransparencyLayer", NDArray[np.bool_])
+"""Transparency of each tile."""
+
+TransparencyVersion: Final = ("TransparencyVersion", int)
+"""Incremented whenever the TransparencyLayer of a map is modified."""
+
+GlyphLayer: Final = ("GlyphLayer", NDArray[np.void])
+"""Terrain and room glyphs of each tile as console graphics."""
+
 
 class Vector2(NamedTuple):
     """Generic X,Y vector."""
@@ -76,15 +105,77 @@ class Vector2(NamedTuple):
 """Gold value."""
 
 
+def is_obstacle(entity: tcod.ecs.Entity) -> bool:
+    """Return True if an entity is an actor or the facet of an actor."""
+    if FacetOf in entity.relation_tag:
+        return IsActor in entity.relation_tag[FacetOf].tags
+    return IsActor in entity.tags
+
+
+def add_occupant(pos: Location, count: int) -> None:
+    """Add `count` occupants to a tile, updating the occupancy layers of the map if they exist."""
+    occupancy = pos.map.components.get(OccupancyLayer)
+    if occupancy is None:
+        return  # Layers are built on demand later.
+    occupancy[pos.ij] += count
+    if pos.map.components[MoveCostLayer][pos.ij]:
+        pos.map.components[PathCostLayer][pos.ij] += OCCUPIED_PENALTY * count
+
+
+CHANGE_CHUNK_SIZE: Final = 32
+"""Width and height of the map chunks tracked by :any:`ChangeSet`."""
+
+
+@attrs.define(eq=False)
+class ChangeSet:
+    """Entities and map chunks changed since the last journaled save.
+
+    Changes are only tracked while this is a component of the global entity, see :any:`game.saving.SaveJournal`.
+    """
+
+    entities: set[tcod.ecs.Entity] = attrs.field(factory=set)
+    """Entities whose components, tags, or relations changed."""
+    chunks: set[tuple[tcod.ecs.Entity, int, int]] = attrs.field(factory=set)
+    """Map and top-left ij coordinates of each chunk with changed map layers."""
+
+
+Changes: Final = ("Changes", ChangeSet)
+"""Changes since the last journaled save."""
+
+
+def mark_changed(entity: tcod.ecs.Entity, *others: tcod.ecs.Entity) -> None:
+    """Record that entities of one registry changed so that the next journaled save includes them."""
+    changes = entity.registry[None].components.get(Changes)
+    if changes is not None:
+        changes.entities.add(entity)
+        changes.entities.update(others)
+
+
+def mark_tile_changed(pos: Location) -> None:
+    """Record that the map layers changed at `pos` so that the next journaled save includes its chunk."""
+    changes = pos.map.registry[None].components.get(Changes)
+    if changes is not None:
+        changes.entities.add(pos.map)
+        changes.chunks.add(
+            (pos.map, pos.y // CHANGE_CHUNK_SIZE * CHANGE_CHUNK_SIZE, pos.x // CHANGE_CHUNK_SIZE * CHANGE_CHUNK_SIZE)
+        )
+
+
 @tcod.ecs.callbacks.register_component_changed(component=Location)
 def on_position_changed(entity: tcod.ecs.Entity, old: Location | None, new: Location | None) -> None:
-    """Track entity positions as tags."""
+    """Track entity positions as tags and tile occupancy."""
     if old == new:
         return
+    mark_changed(entity)
+    obstacle = is_obstacle(entity)
     if old is not None:
         entity.tags.remove(old)
+        if obstacle:
+            add_occupant(old, -1)
     if new is not None:
         entity.tags.add(new)
+        if obstacle:
+            add_occupant(new, 1)
 
 
 AI: Final = ("AI", Action)
@@ -98,5 +189,20 @@ def on_position_changed(entity: tcod.ecs.Entity, old: Location | None, new: Loca
 Str: Final = ("Str", int)
 """Entity strength."""
 
+SightRadius: Final = ("SightRadius", int)
+"""Maximum distance an entity can see, zero for unlimited."""
+
 Name: Final = ("Name", int)
 """Entity name."""
+
+SiteFile: Final = ("SiteFile", str)
+"""Path of the file a site is stored in while it is evicted."""
+
+EvictedAt: Final = ("EvictedAt", int)
+"""Tick a site was evicted at, sites with this component are stored in their :any:`SiteFile`."""
+
+PendingSiteWrite: Final = ("PendingSiteWrite", Future[None])
+"""Background write of the :any:`SiteFile` of an evicted site which may not have finished yet."""
+
+LastActiveTick: Final = ("LastActiveTick", int)
+"""Last tick the player was at a site."""
@@ -38,3 +38,14 @@
 
 LABEL_COLOR = ((0x80, 0x80, 0x80), None)
 LABEL_SELECTED = ((0xFF, 0xFF, 0xFF), (0x40, 0x40, 0x40))
+
+MAX_QUEUED_ACTIONS = 2
+"""Player actions kept while waiting for the player's turn, any more input is dropped."""
+
+GOD_MODE_SPEEDS = {
+    tcod.event.KeySym.N1: 1,
+    tcod.event.KeySym.N2: 4,
+    tcod.event.KeySym.N3: 16,
+    tcod.event.KeySym.N4: None,
+}
+"""God mode speeds by key, as player turns per frame or None for as many as fit in the frame budget."""
@@ -0,0 +1,121 @@
+"""Field-of-view functions."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+
+import attrs
+import numpy as np
+import tcod.constants
+import tcod.ecs
+import tcod.map
+from numpy.typing import NDArray
+
+from game.components import Location, TilesLayer, TransparencyLayer, TransparencyVersion
+from game.tile import TileDB
+
+FOVKey = tuple[tcod.ecs.Entity, tuple[int, int], int, int]
+"""FOV cache key of map, origin, radius, and transparency version."""
+
+
+@attrs.define(frozen=True)
+class FieldOfView:
+    """Visible area of a window of a map.
+
+    Use ``ij in fov`` to check if a map position is visible.
+    """
+
+    visible: NDArray[np.bool_]
+    """Visible tiles of the window."""
+    i: int
+    """Top of the window on the map."""
+    j: int
+    """Left side of the window on the map."""
+
+    def __contains__(self, ij: tuple[int, int]) -> bool:
+        """Return True if map position `ij` is visible."""
+        i = ij[0] - self.i
+        j = ij[1] - self.j
+        height, width = self.visible.shape
+        return 0 <= i < height and 0 <= j < width and bool(self.visible[i, j])
+
+
+class FOVCache:
+    """Least recently used cache of computed FOV arrays.
+
+    This is a cache and is never saved, an empty cache is restored on load.
+    """
+
+    __slots__ = ("max_size", "results")
+
+    def __init__(self, max_size: int = 256) -> None:
+        """Initialize an empty cache."""
+        self.results: OrderedDict[FOVKey, FieldOfView] = OrderedDict()
+        self.max_size = max_size
+
+    def __reduce__(self) -> tuple[type[FOVCache], tuple[int]]:
+        """Discard cached results when serialized."""
+        return self.__class__, (self.max_size,)
+
+    def get(self, key: FOVKey) -> FieldOfView | None:
+        """Return a cached FOV or None."""
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+        return result
+
+    def put(self, key: FOVKey, fov: FieldOfView) -> None:
+        """Store a FOV result, evicting the least recently used results."""
+        fov.visible.flags.writeable = False
+        self.results[key] = fov
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+
+def get_transparency(map_: tcod.ecs.Entity) -> NDArray[np.bool_]:
+    """Return the transparency layer of a map, building it if it does not exist.
+
+    The returned array is kept up to date and must not be modified by the caller.
+    """
+    transparency = map_.components.get(TransparencyLayer)
+    if transparency is None:
+        tile_db = map_.registry[None].components[TileDB]
+        map_.components[TransparencyLayer] = transparency = tile_db.data["transparent"][map_.components[TilesLayer]]
+    return transparency
+
+
+def update_tile_transparency(pos: Location) -> None:
+    """Update the transparency layer after the tile at `pos` was changed."""
+    transparency = pos.map.components.get(TransparencyLayer)
+    if transparency is None:
+        return  # Layer is built on demand later.
+    tile_db = pos.map.registry[None].components[TileDB]
+    transparent = bool(tile_db.data["transparent"][pos.map.components[TilesLayer][pos.ij]])
+    if transparency[pos.ij] != transparent:
+        transparency[pos.ij] = transparent
+        pos.map.components[TransparencyVersion] = pos.map.components.get(TransparencyVersion, 0) + 1
+
+
+def compute_fov(pos: Location, radius: int = 0) -> FieldOfView:
+    """Return the area visible from `pos`, reusing cached results while the map transparency is unchanged.
+
+    If `radius` is non-zero then only the window within `radius` of `pos` is computed.
+    The returned result is shared and read-only.
+    """
+    cache = pos.map.registry[None].components.setdefault(FOVCache, FOVCache())
+    key = (pos.map, pos.ij, radius, pos.map.components.get(TransparencyVersion, 0))
+    fov = cache.get(key)
+    if fov is None:
+        transparency = get_transparency(pos.map)
+        i0 = j0 = 0
+        if radius:
+            height, width = transparency.shape
+            i0, j0 = max(0, pos.y - radius), max(0, pos.x - radius)
+            transparency = transparency[i0 : min(height, pos.y + radius + 1), j0 : min(width, pos.x + radius + 1)]
+        visible = tcod.map.compute_fov(
+            transparency, (pos.y - i0, pos.x - j0), radius, algorithm=tcod.constants.FOV_SYMMETRIC_SHADOWCAST
+        )
+        fov = FieldOfView(visible, i0, j0)
+        cache.put(key, fov)
+    return fov
@@ -0,0 +1,42 @@
+"""Frame timing statistics."""
+
+from __future__ import annotations
+
+from collections import deque
+
+import attrs
+
+
+@attrs.define
+class FrameStats:
+    """Frame times recorded by the main loop."""
+
+    frame_times: deque[float] = attrs.field(factory=lambda: deque(maxlen=240))
+    """Seconds of work done by each recent frame, not including time spent idle or waiting for the frame cap."""
+    frames: int = 0
+    """Total number of frames."""
+    renders: int = 0
+    """Total number of frames which were redrawn."""
+
+    def record(self, seconds: float, *, rendered: bool) -> None:
+        """Record the work time of one frame."""
+        self.frame_times.append(seconds)
+        self.frames += 1
+        self.renders += rendered
+
+    @property
+    def mean(self) -> float:
+        """Mean time of recent frames in seconds."""
+        return sum(self.frame_times) / len(self.frame_times) if self.frame_times else 0.0
+
+    @property
+    def worst(self) -> float:
+        """Slowest recent frame in seconds."""
+        return max(self.frame_times, default=0.0)
+
+    def __str__(self) -> str:
+        """Return a summary of these stats."""
+        return (
+            f"{self.frames} frames, {self.renders} redrawn,"
+            f" recent frame time {self.mean * 1000:.2f}ms mean {self.worst * 1000:.2f}ms worst"
+        )
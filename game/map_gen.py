@@ -2,18 +2,42 @@
 
 from __future__ import annotations
 
+from collections.abc import Callable
 from random import Random
+from typing import Final
 
 import attrs
 import numpy as np
 import tcod.ecs
+from numpy.typing import NDArray
+from scipy import ndimage
 
 from game.actions import HostileAI
 from game.actor_logic import spawn_actor
 from game.components import Gold, Location, RoomTypeLayer, Shape, TilesLayer
 from game.faction import Faction
+from game.sites import new_site
 from game.tile import TileDB
 
+GRASS_WIDTH: Final = 16
+"""Width of the strip of grass on the west side of a cave map."""
+
+
+@attrs.define(frozen=True)
+class CaveConfig:
+    """Parameters of the cave generator."""
+
+    wall_density: float = 0.47
+    """Fraction of walls in the initial noise, higher values make smaller caves."""
+    smoothing_steps: int = 4
+    """Cellular automaton steps, more steps make smoother cave walls."""
+    gold_density: float = 0.015
+    """Gold piles per cave floor tile."""
+    gold_amount: tuple[int, int] = (10, 50)
+    """Inclusive range of gold in each pile."""
+    orc_density: float = 0.007
+    """Orcs per cave floor tile when the number of orcs is not given."""
+
 
 @attrs.define
 class Rect:
@@ -39,32 +63,139 @@ def get_random_pos(self, map_: tcod.ecs.Entity) -> Location:
         )
 
 
-def generate_cave_map(registry: tcod.ecs.Registry) -> tcod.ecs.Entity:
-    """Return a new cave map."""
-    rng = registry[None].components[Random]
+def _count_walls(walls: NDArray[np.uint8]) -> NDArray[np.uint8]:
+    """Return the number of walls in the 3x3 neighborhood of each tile, tiles outside of the array count as walls.
+
+    This is a 3x3 box convolution done as sums of shifted views, which is much faster than a general convolution.
+    """
+    padded = np.pad(walls, 1, constant_values=1)
+    rows = padded[:-2] + padded[1:-1] + padded[2:]
+    counts: NDArray[np.uint8] = rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+    return counts
+
+
+def generate_cave_floor(
+    np_rng: np.random.Generator,
+    shape: tuple[int, int],
+    config: CaveConfig,
+    progress: Callable[[float], None] | None = None,
+) -> NDArray[np.bool_]:
+    """Return a mask of connected cave floor of `shape`.
+
+    Random noise is smoothed by a cellular automaton, then only the largest connected area of floor is kept.
+    `progress` is called with the completed fraction after each step.
+    """
+    total_steps = config.smoothing_steps + 2
+    walls = (np_rng.random(shape, dtype=np.float32) < config.wall_density).view(np.uint8)
+    for step in range(config.smoothing_steps):
+        if progress is not None:
+            progress((step + 1) / total_steps)
+        walls = (_count_walls(walls) >= 5).view(np.uint8)  # noqa: PLR2004
+    if progress is not None:
+        progress((total_steps - 1) / total_steps)
+    labels, count = ndimage.label(walls == 0)
+    if not count:
+        return np.zeros(shape, dtype=np.bool_)
+    sizes = np.bincount(labels.ravel())
+    sizes[0] = 0  # Walls
+    floor: NDArray[np.bool_] = labels == sizes.argmax()
+    return floor
+
+
+@attrs.define(eq=False)
+class CavePlan:
+    """A generated cave as arrays and spawn lists, made by :any:`plan_cave` and built by :any:`build_cave_map`.
+
+    Plans do not reference a registry, so they can be made in another process.
+    """
+
+    seed: int
+    """Seed this plan was generated from."""
+    floor: NDArray[np.bool_]
+    """Mask of cave floor tiles of the whole map."""
+    gold_positions: NDArray[np.intp]
+    """Positions of gold piles as an array of (x, y) rows."""
+    gold_amounts: NDArray[np.int64]
+    """Gold in each pile."""
+    orc_positions: NDArray[np.intp]
+    """Positions of orcs as an array of (x, y) rows."""
+
+
+def plan_cave(  # noqa: PLR0913
+    seed: int,
+    width: int = 128,
+    height: int = 128,
+    orcs: int | None = None,
+    config: CaveConfig | None = None,
+    progress: Callable[[float], None] | None = None,
+) -> CavePlan:
+    """Return the plan of a new cave map.
+
+    The cave is east of a strip of grass and is not connected to it.
+    `orcs` is the number of orcs to spawn on random floor tiles, by default this is derived from `config`.
+    `progress` is called with the completed fraction during generation.
+    """
+    config = config if config is not None else CaveConfig()
+    np_rng = np.random.default_rng(seed)
+    floor = np.zeros((height, width), dtype=np.bool_)
+    cave = floor[1:-1, GRASS_WIDTH + 1 : -1]  # Keep a wall between the grass and the cave
+    cave[:] = generate_cave_floor(np_rng, cave.shape, config, progress)
+
+    floor_indexes = np.flatnonzero(cave)
+    gold_count = int(np_rng.binomial(floor_indexes.size, config.gold_density))
+    orc_count = int(np_rng.binomial(floor_indexes.size, config.orc_density)) if orcs is None else orcs
+    # Gold and orcs are placed on distinct tiles, orcs may share tiles if there are not enough floor tiles
+    picks = np_rng.choice(floor_indexes, min(gold_count + orc_count, floor_indexes.size), replace=False)
+    gold_picks, orc_picks = picks[:gold_count], picks[gold_count:]
+    if orc_picks.size < orc_count and floor_indexes.size:
+        orc_picks = np.concatenate([orc_picks, np_rng.choice(floor_indexes, orc_count - orc_picks.size)])
+    gold_amounts = np_rng.integers(config.gold_amount[0], config.gold_amount[1], size=gold_count, endpoint=True)
+    if progress is not None:
+        progress(1.0)
+
+    offset = np.array([GRASS_WIDTH + 1, 1])  # Cave positions to map positions
+    return CavePlan(
+        seed=seed,
+        floor=floor,
+        gold_positions=np.stack(np.unravel_index(gold_picks, cave.shape)[::-1], axis=-1) + offset,
+        gold_amounts=gold_amounts,
+        orc_positions=np.stack(np.unravel_index(orc_picks, cave.shape)[::-1], axis=-1) + offset,
+    )
+
+
+def build_cave_map(registry: tcod.ecs.Registry, plan: CavePlan, name: str = "Cave") -> tcod.ecs.Entity:
+    """Return a new site called `name` with the map and spawns of a cave plan."""
     tile_db = registry[None].components[TileDB]
-    map_ = registry[object()]
-    map_.components[Shape] = shape = Shape(128, 128)
+    map_ = new_site(registry, name)
+    map_.components[Shape] = shape = Shape(*plan.floor.shape)
     map_.components[TilesLayer] = tiles = np.zeros(shape, dtype=np.uint8)
     map_.components[RoomTypeLayer] = np.zeros(shape, dtype=np.uint8)
     tiles[:] = tile_db.names["bedrock"]
     tiles[1:-1, 1:-1] = tile_db.names["rock wall"]
-    tiles[:, :16] = tile_db.names["grass"]
-    for y in range(0, 128, 16):
-        for x in range(16, 128, 16):
-            width = rng.randint(4, 14)
-            height = rng.randint(4, 14)
-            rect = Rect(x + rng.randint(1, 16 - width - 1), y + rng.randint(1, 16 - height - 1), width, height)
-            tiles[rect.inner] = tile_db.names["rock floor"]
-            for _ in range(2):
-                obj = registry["gold"].instantiate()
-                obj.components[Location] = rect.get_random_pos(map_)
-                obj.components[Gold] = rng.randint(10, 50)
-            spawn_actor(
-                registry["orc"],
-                pos=rect.get_random_pos(map_),
-                ai=HostileAI(),
-                faction=Faction.Hostile,
-            )
+    tiles[:, :GRASS_WIDTH] = tile_db.names["grass"]
+    tiles[:] = np.where(plan.floor, tile_db.names["rock floor"], tiles)
+
+    for (x, y), amount in zip(plan.gold_positions.tolist(), plan.gold_amounts.tolist(), strict=True):
+        obj = registry["gold"].instantiate()
+        obj.components[Location] = Location(x, y, map_)
+        obj.components[Gold] = amount
+    for x, y in plan.orc_positions.tolist():
+        spawn_actor(registry["orc"], pos=Location(x, y, map_), ai=HostileAI(), faction=Faction.Hostile)
 
     return map_
+
+
+def generate_cave_map(  # noqa: PLR0913
+    registry: tcod.ecs.Registry,
+    width: int = 128,
+    height: int = 128,
+    orcs: int | None = None,
+    name: str = "Cave",
+    config: CaveConfig | None = None,
+) -> tcod.ecs.Entity:
+    """Return a new cave map as a site called `name`, see :any:`plan_cave` for the parameters.
+
+    The cave is seeded from the world's random number generator.
+    """
+    seed = registry[None].components[Random].getrandbits(64)
+    return build_cave_map(registry, plan_cave(seed, width, height, orcs, config), name)
@@ -4,18 +4,14 @@
 
 import g
 import game.states
-from game.action_logic import simulate
 from game.state import State  # noqa: TC001
 from game.widget import Widget  # noqa: TC001
 from game.widgets import Button, ListMenu
-from game.world_init import new_world
 
 
 def new_game() -> State | None:
-    """Start a new game."""
-    g.registry = new_world()
-    simulate(g.registry)
-    return game.states.InGame()
+    """Start a new game, showing its progress until the next world has finished generating."""
+    return game.states.GeneratingWorld(g.pregen.take_world())
 
 
 def save_and_quit() -> State | None:
@@ -0,0 +1,296 @@
+"""Hierarchical pathfinding over fixed size chunks of a map.
+
+Maps are divided into square chunks.
+Where open tiles of two orthogonally adjacent chunks touch, entrances are placed on both sides of their border, these
+entrances are the nodes of an abstract graph.
+Entrances within a chunk are connected by edges whose costs come from a Dijkstra search limited to that chunk.
+Chunks are built on demand while searching and cached until a tile in or next to them is changed.
+Searches between tiles of different connected regions fail without searching, regions are labeled on demand and
+relabeled after any change.
+
+A search over the abstract graph returns waypoints, only the segment to the next waypoint is refined to tiles at a
+time by :any:`refine_segment`.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Final
+
+import attrs
+import numpy as np
+import tcod.ecs
+import tcod.path
+from numpy.typing import NDArray
+
+from game.pathfinding import PathStrategy, get_terrain_cost, record_path_stats
+from game.tile import TileDB
+
+if TYPE_CHECKING:
+    from game.components import Location
+
+CHUNK_SIZE: Final = 32
+"""Width and height of a chunk in tiles."""
+
+ENTRANCE_SPLIT: Final = 6
+"""Openings along a border at least this wide get an entrance at both ends instead of one in the middle."""
+
+HEURISTIC_WEIGHT: Final = 1.25
+"""Weight of the abstract search heuristic, above 1 this expands far fewer nodes for slightly longer paths."""
+
+_CARDINAL: Final = 2
+_DIAGONAL: Final = 3
+
+type _Index = tuple[int, int]
+"""An ij index of a tile."""
+
+type _Border = tuple[int, int, int]
+"""A chunk ij and the axis of the border on its far side, 0 for the border below and 1 for the border to the right."""
+
+
+@attrs.define(eq=False)
+class _Chunk:
+    """Cached abstract graph of one chunk."""
+
+    edges: dict[_Index, dict[_Index, int]]
+    """Costs between the entrances of this chunk, by entrance."""
+    links: dict[_Index, list[tuple[_Index, int]]]
+    """Entrances of neighboring chunks across a border and the cost to step onto them, by entrance."""
+
+
+@attrs.define(eq=False)
+class _Search:
+    """Temporary edges of the start and goal of one abstract search."""
+
+    start: _Index
+    goal: _Index
+    start_edges: list[tuple[_Index, int]]
+    """Costs from the start to the entrances of its chunk and to the goal if it shares the chunk."""
+    to_goal: dict[_Index, int]
+    """Costs from the entrances of the goal chunk to the goal."""
+
+
+class PathHierarchy:
+    """Abstract chunk graph of a map.
+
+    This is a cache and is never saved, an empty hierarchy is restored on load.
+    """
+
+    __slots__ = ("_borders", "_chunks", "_regions", "chunk_size")
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE) -> None:
+        """Initialize an empty hierarchy."""
+        self.chunk_size = chunk_size
+        self._borders: dict[_Border, list[tuple[_Index, _Index]]] = {}
+        self._chunks: dict[_Index, _Chunk] = {}
+        self._regions: NDArray[np.int32] | None = None
+        """Connected region label of each tile, zero for tiles not labeled yet."""
+
+    def __reduce__(self) -> tuple[type[PathHierarchy], tuple[int]]:
+        """Discard cached chunks when serialized."""
+        return self.__class__, (self.chunk_size,)
+
+    def chunk_of(self, ij: _Index) -> _Index:
+        """Return the chunk of a tile."""
+        return ij[0] // self.chunk_size, ij[1] // self.chunk_size
+
+    def _window(self, shape: tuple[int, ...], chunk: _Index) -> tuple[slice, slice]:
+        """Return the slices of a chunk clipped to a map of `shape`."""
+        i, j = chunk[0] * self.chunk_size, chunk[1] * self.chunk_size
+        return slice(i, min(i + self.chunk_size, shape[0])), slice(j, min(j + self.chunk_size, shape[1]))
+
+    def invalidate(self, ij: _Index) -> None:
+        """Discard the cached parts of the graph affected by a change to the tile at `ij`."""
+        ci, cj = self.chunk_of(ij)
+        for border in ((ci, cj, 0), (ci, cj, 1), (ci - 1, cj, 0), (ci, cj - 1, 1)):
+            self._borders.pop(border, None)
+        for chunk in ((ci, cj), (ci - 1, cj), (ci + 1, cj), (ci, cj - 1), (ci, cj + 1)):
+            self._chunks.pop(chunk, None)  # Neighbors gain or lose entrances on the shared borders
+        self._regions = None  # Regions may have been joined or split
+
+    def _get_border(self, cost: NDArray[np.int32], border: _Border) -> list[tuple[_Index, _Index]]:
+        """Return the entrances of a border as (near, far) pairs, near being the tile in the chunk of the border."""
+        if border in self._borders:
+            return self._borders[border]
+        ci, cj, axis = border
+        size = self.chunk_size
+        entrances: list[tuple[_Index, _Index]] = []
+        self._borders[border] = entrances
+        near = (ci if axis == 0 else cj) * size + size - 1
+        across = ci if axis == 1 else cj
+        start, stop = across * size, min(across * size + size, cost.shape[1 - axis])
+        if ci < 0 or cj < 0 or near + 1 >= cost.shape[axis]:
+            return entrances
+        if axis == 0:
+            is_open = (cost[near, start:stop] != 0) & (cost[near + 1, start:stop] != 0)
+        else:
+            is_open = (cost[start:stop, near] != 0) & (cost[start:stop, near + 1] != 0)
+        edges = np.diff(is_open.astype(np.int8), prepend=0, append=0)
+        for run_start, run_stop in zip(
+            np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist(), strict=True
+        ):
+            if run_stop - run_start >= ENTRANCE_SPLIT:
+                offsets = [start + run_start, start + run_stop - 1]
+            else:
+                offsets = [start + (run_start + run_stop - 1) // 2]
+            for offset in offsets:
+                if axis == 0:
+                    entrances.append(((near, offset), (near + 1, offset)))
+                else:
+                    entrances.append(((offset, near), (offset, near + 1)))
+        return entrances
+
+    def _get_chunk(self, cost: NDArray[np.int32], chunk: _Index) -> _Chunk:
+        """Return the abstract graph of a chunk, building it if needed."""
+        if chunk in self._chunks:
+            return self._chunks[chunk]
+        ci, cj = chunk
+        links: dict[_Index, list[tuple[_Index, int]]] = {}
+        for near, far in (*self._get_border(cost, (ci, cj, 0)), *self._get_border(cost, (ci, cj, 1))):
+            links.setdefault(near, []).append((far, _CARDINAL * int(cost[far])))
+        for far, near in (*self._get_border(cost, (ci - 1, cj, 0)), *self._get_border(cost, (ci, cj - 1, 1))):
+            links.setdefault(near, []).append((far, _CARDINAL * int(cost[far])))
+        edges = {node: self._local_costs(cost, node, links) for node in links}
+        self._chunks[chunk] = result = _Chunk(edges=edges, links=links)
+        return result
+
+    def _region_of(self, cost: NDArray[np.int32], ij: _Index) -> int:
+        """Return the label of the connected region of a tile, labeling that region if needed."""
+        if self._regions is None or self._regions.shape != cost.shape:
+            self._regions = np.zeros(cost.shape, dtype=np.int32)
+        label = int(self._regions[ij])
+        if not label:
+            distance: NDArray[np.int32] = tcod.path.maxarray(cost.shape, dtype=np.int32)
+            distance[ij] = 0
+            tcod.path.dijkstra2d(distance, cost, _CARDINAL, _DIAGONAL, out=distance)
+            label = int(self._regions.max()) + 1
+            self._regions[distance != np.iinfo(np.int32).max] = label
+        return label
+
+    def _local_costs(self, cost: NDArray[np.int32], origin: _Index, targets: Iterable[_Index]) -> dict[_Index, int]:
+        """Return the costs from `origin` to the `targets` in its chunk which can be reached without leaving it."""
+        window = self._window(cost.shape, self.chunk_of(origin))
+        i0, j0 = window[0].start, window[1].start
+        distance: NDArray[np.int32] = tcod.path.maxarray(cost[window].shape, dtype=np.int32)
+        distance[origin[0] - i0, origin[1] - j0] = 0
+        tcod.path.dijkstra2d(distance, cost[window], _CARDINAL, _DIAGONAL, out=distance)
+        unreachable = np.iinfo(np.int32).max
+        costs = {}
+        for target in targets:
+            value = int(distance[target[0] - i0, target[1] - j0])
+            if target != origin and value != unreachable:
+                costs[target] = value
+        return costs
+
+    def _neighbors(self, cost: NDArray[np.int32], search: _Search, node: _Index) -> list[tuple[_Index, int]]:
+        """Return the abstract neighbors of a node and the costs to reach them."""
+        chunk = self._get_chunk(cost, self.chunk_of(node))
+        neighbors = [*chunk.edges.get(node, {}).items(), *chunk.links.get(node, [])]
+        if node == search.start:  # The start is usually not an entrance
+            neighbors += search.start_edges
+        if node in search.to_goal:
+            neighbors.append((search.goal, search.to_goal[node]))
+        return neighbors
+
+    def find_waypoints(
+        self, cost: NDArray[np.int32], start: _Index, goal: _Index, min_step_cost: int
+    ) -> tuple[list[_Index] | None, int]:
+        """Return the abstract path from `start` to `goal` and the number of nodes expanded to find it.
+
+        The path is a list of waypoints ending with `goal`, or None if not found.
+        `min_step_cost` is the lowest nonzero cost of a tile, the heuristic is scaled by it and :any:`HEURISTIC_WEIGHT`.
+        """
+        if not cost[goal] or self._region_of(cost, start) != self._region_of(cost, goal):
+            return None, 0
+        if start == goal:
+            return [goal], 0
+        start_chunk, goal_chunk = self.chunk_of(start), self.chunk_of(goal)
+        start_targets = [*self._get_chunk(cost, start_chunk).links, *[goal] * (start_chunk == goal_chunk)]
+        search = _Search(
+            start=start,
+            goal=goal,
+            start_edges=list(self._local_costs(cost, start, start_targets).items()),
+            # Costs to the goal are approximated by the costs from the goal
+            to_goal=self._local_costs(cost, goal, self._get_chunk(cost, goal_chunk).links),
+        )
+
+        weight = min_step_cost * HEURISTIC_WEIGHT
+
+        def heuristic(ij: _Index) -> float:
+            di, dj = abs(ij[0] - goal[0]), abs(ij[1] - goal[1])
+            return weight * (_CARDINAL * max(di, dj) + (_DIAGONAL - _CARDINAL) * min(di, dj))
+
+        best: dict[_Index, int] = {start: 0}
+        came_from: dict[_Index, _Index] = {}
+        heap: list[tuple[float, int, _Index]] = [(heuristic(start), 0, start)]
+        expanded = 0
+        while heap:
+            _estimate, node_cost, node = heapq.heappop(heap)
+            if node_cost > best[node]:
+                continue
+            expanded += 1
+            if node == goal:
+                waypoints = [goal]
+                while (node := came_from[node]) != start:
+                    waypoints.append(node)
+                return waypoints[::-1], expanded
+            for neighbor, step_cost in self._neighbors(cost, search, node):
+                new_cost = node_cost + step_cost
+                if new_cost < best.get(neighbor, new_cost + 1):
+                    best[neighbor] = new_cost
+                    came_from[neighbor] = node
+                    heapq.heappush(heap, (new_cost + heuristic(neighbor), new_cost, neighbor))
+        return None, expanded
+
+    def refine_segment(self, cost: NDArray[np.int32], start: _Index, goal: _Index) -> NDArray[np.intc]:
+        """Return the tiles from `start` to the next waypoint `goal`, excluding `start`.
+
+        The search is limited to the chunks of both ends, which is where the abstract graph found the segment.
+        """
+        (ci0, cj0), (ci1, cj1) = self.chunk_of(start), self.chunk_of(goal)
+        top_left = self._window(cost.shape, (min(ci0, ci1), min(cj0, cj1)))
+        bottom_right = self._window(cost.shape, (max(ci0, ci1), max(cj0, cj1)))
+        i0, j0 = top_left[0].start, top_left[1].start
+        path = tcod.path.path2d(
+            cost[i0 : bottom_right[0].stop, j0 : bottom_right[1].stop],
+            start_points=[(start[0] - i0, start[1] - j0)],
+            end_points=[(goal[0] - i0, goal[1] - j0)],
+            cardinal=_CARDINAL,
+            diagonal=_DIAGONAL,
+        )
+        path += (i0, j0)
+        return path[1:]
+
+
+def get_path_hierarchy(map_: tcod.ecs.Entity) -> PathHierarchy:
+    """Return the path hierarchy of a map."""
+    return map_.components.setdefault(PathHierarchy, PathHierarchy())
+
+
+def min_step_cost(registry: tcod.ecs.Registry) -> int:
+    """Return the lowest movement cost of any walkable tile."""
+    move_cost = registry[None].components[TileDB].data["move_cost"]
+    walkable = move_cost[move_cost != 0]
+    return int(walkable.min()) if walkable.size else 1
+
+
+def find_waypoints(map_: tcod.ecs.Entity, start: _Index, goal: _Index) -> list[_Index] | None:
+    """Return the abstract path between two tiles of a map as waypoints ending with `goal`, or None if not found."""
+    waypoints, expanded = get_path_hierarchy(map_).find_waypoints(
+        get_terrain_cost(map_), start, goal, min_step_cost(map_.registry)
+    )
+    record_path_stats(map_.registry, PathStrategy.Hierarchical, requests=1, expanded=expanded)
+    return waypoints
+
+
+def refine_segment(map_: tcod.ecs.Entity, start: _Index, goal: _Index) -> NDArray[np.intc]:
+    """Return the ij path from `start` to the waypoint `goal`, excluding `start`."""
+    return get_path_hierarchy(map_).refine_segment(get_terrain_cost(map_), start, goal)
+
+
+def invalidate_path_hierarchy(pos: Location) -> None:
+    """Discard the cached chunk graphs around a changed tile."""
+    hierarchy = pos.map.components.get(PathHierarchy)
+    if hierarchy is not None:
+        hierarchy.invalidate(pos.ij)
@@ -0,0 +1,269 @@
+"""Shared pathfinding data."""
+
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from collections.abc import Hashable, Iterable
+from enum import Enum
+from typing import Final
+
+import attrs
+import numpy as np
+import tcod.ecs
+import tcod.path
+from numpy.typing import NDArray
+
+from game.components import (
+    OCCUPIED_PENALTY,
+    Location,
+    MoveCostLayer,
+    OccupancyLayer,
+    PathCostLayer,
+    Shape,
+    TerrainVersion,
+    TilesLayer,
+    is_obstacle,
+)
+from game.tile import TileDB
+
+MAX_SEARCH_NODES: Final = 64 * 64
+"""Default node budget of :any:`find_path`."""
+
+_SEARCH_PADDING: Final = (4, 16, 64)
+"""Tiles around the bounding box of the start and goal searched by each widening step of :any:`find_path`."""
+
+
+class PathStrategy(Enum):
+    """Search strategies of :any:`FollowPath.path_to`."""
+
+    AStar = "A*"
+    """Goal-directed search from the actor which stops once the target is reached."""
+    Dijkstra = "Dijkstra"
+    """Full distance field from the target shared by all actors heading there, see :any:`get_flow_field`."""
+    Hierarchical = "HPA*"
+    """Search over the chunk graph of :any:`game.path_hierarchy` for distant targets, see :any:`find_waypoints`."""
+
+
+@attrs.define
+class PathStats:
+    """Pathfinding statistics collected while this is a component of the global entity."""
+
+    requests: Counter[PathStrategy] = attrs.field(factory=Counter)
+    """Number of paths requested with each strategy."""
+    expanded: Counter[PathStrategy] = attrs.field(factory=Counter)
+    """Total nodes expanded by each strategy, flow fields reused from the cache expand no nodes."""
+
+    def expanded_per_request(self, strategy: PathStrategy) -> float:
+        """Return the average nodes expanded per request of `strategy`."""
+        return self.expanded[strategy] / self.requests[strategy] if self.requests[strategy] else 0.0
+
+
+def record_path_stats(registry: tcod.ecs.Registry, strategy: PathStrategy, *, requests: int, expanded: int) -> None:
+    """Add to the pathfinding statistics if they are being collected."""
+    stats = registry[None].components.get(PathStats)
+    if stats is not None:
+        stats.requests[strategy] += requests
+        stats.expanded[strategy] += expanded
+
+
+@attrs.define(eq=False)
+class FlowField:
+    """Distance field descending towards a set of roots."""
+
+    terrain_version: int
+    roots: NDArray[np.bool_]
+    distance: NDArray[np.int32]
+
+
+class FlowFieldCache:
+    """Per-map cache of goal distance fields shared by all actors on that map.
+
+    Fields are keyed by a goal name and are only rebuilt when their roots or the terrain changes.
+    This is a cache and is never saved, an empty cache is restored on load.
+    """
+
+    __slots__ = ("fields", "max_fields")
+
+    def __init__(self, max_fields: int = 16) -> None:
+        """Initialize an empty cache."""
+        self.fields: OrderedDict[Hashable, FlowField] = OrderedDict()
+        self.max_fields = max_fields
+
+    def __reduce__(self) -> tuple[type[FlowFieldCache], tuple[int]]:
+        """Discard cached fields when serialized."""
+        return self.__class__, (self.max_fields,)
+
+    def get(self, goal: Hashable, terrain_version: int, roots: NDArray[np.bool_]) -> FlowField | None:
+        """Return a still valid cached field for `goal`, or None."""
+        field = self.fields.get(goal)
+        if field is None:
+            return None
+        if field.terrain_version != terrain_version or not np.array_equal(field.roots, roots):
+            del self.fields[goal]
+            return None
+        self.fields.move_to_end(goal)
+        return field
+
+    def put(self, goal: Hashable, field: FlowField) -> None:
+        """Store a field, evicting the least recently used fields."""
+        self.fields[goal] = field
+        self.fields.move_to_end(goal)
+        while len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+
+
+def _init_cost_layers(map_: tcod.ecs.Entity) -> None:
+    """Build the cost layers of a map from its tiles and current occupants."""
+    tile_db = map_.registry[None].components[TileDB]
+    move_cost = tile_db.data["move_cost"][map_.components[TilesLayer]].astype(np.int32)
+    occupancy = np.zeros_like(move_cost)
+    for entity in map_.registry.Q.all_of(components=[Location]):
+        pos = entity.components[Location]
+        if pos.map is map_ and is_obstacle(entity):
+            occupancy[pos.ij] += 1
+    map_.components[MoveCostLayer] = move_cost
+    map_.components[OccupancyLayer] = occupancy
+    map_.components[PathCostLayer] = np.where(move_cost != 0, move_cost + OCCUPIED_PENALTY * occupancy, 0)
+
+
+def get_terrain_cost(map_: tcod.ecs.Entity) -> NDArray[np.int32]:
+    """Return the terrain movement cost of a map, ignoring any occupants.
+
+    The returned array is kept up to date and must not be modified by the caller.
+    """
+    if MoveCostLayer not in map_.components:
+        _init_cost_layers(map_)
+    return map_.components[MoveCostLayer]
+
+
+def get_path_cost(map_: tcod.ecs.Entity) -> NDArray[np.int32]:
+    """Return the movement cost of a map with penalties for occupied tiles.
+
+    The returned array is kept up to date and must not be modified by the caller.
+    """
+    if PathCostLayer not in map_.components:
+        _init_cost_layers(map_)
+    return map_.components[PathCostLayer]
+
+
+def update_tile_cost(pos: Location) -> None:
+    """Update the cost layers after the tile at `pos` was changed."""
+    if MoveCostLayer not in pos.map.components:
+        return  # Layers are built on demand later.
+    tile_db = pos.map.registry[None].components[TileDB]
+    move_cost = tile_db.data["move_cost"].item(pos.map.components[TilesLayer].item(pos.ij))
+    pos.map.components[MoveCostLayer][pos.ij] = move_cost
+    pos.map.components[PathCostLayer][pos.ij] = (
+        move_cost + OCCUPIED_PENALTY * pos.map.components[OccupancyLayer][pos.ij] if move_cost else 0
+    )
+
+
+def positions_to_roots(map_: tcod.ecs.Entity, positions: Iterable[Location]) -> NDArray[np.bool_]:
+    """Return a root mask from the positions which are on `map_`."""
+    roots = np.zeros(map_.components[Shape], dtype=np.bool_)
+    for pos in positions:
+        if pos.map is map_:
+            roots[pos.ij] = True
+    return roots
+
+
+def compute_flow_field(map_: tcod.ecs.Entity, roots: NDArray[np.bool_]) -> NDArray[np.int32]:
+    """Return a distance field towards `roots` over the terrain cost without caching it.
+
+    This is for one-off target sets which no other actor will share, caching them would only evict shared fields.
+    The nodes reached are added to the pathfinding statistics.
+    """
+    distance: NDArray[np.int32] = tcod.path.maxarray(roots.shape, dtype=np.int32)
+    distance[roots] = 0
+    tcod.path.dijkstra2d(distance, get_terrain_cost(map_), 2, 3, out=distance)
+    if PathStats in map_.registry[None].components:
+        expanded = int(np.count_nonzero(distance != np.iinfo(distance.dtype).max))
+        record_path_stats(map_.registry, PathStrategy.Dijkstra, requests=0, expanded=expanded)
+    return distance
+
+
+def get_flow_field(map_: tcod.ecs.Entity, goal: Hashable, roots: NDArray[np.bool_]) -> NDArray[np.int32]:
+    """Return the shared distance field for `goal` on `map_`.
+
+    `goal` names the field such as ``"loose gold"`` or ``("entity", target)``.
+    The field is recomputed only if `roots` differs from the cached roots or the terrain was modified.
+    """
+    cache = map_.components.setdefault(FlowFieldCache, FlowFieldCache())
+    terrain_version = map_.components.get(TerrainVersion, 0)
+    field = cache.get(goal, terrain_version, roots)
+    if field is None:
+        field = FlowField(terrain_version=terrain_version, roots=roots.copy(), distance=compute_flow_field(map_, roots))
+        cache.put(goal, field)
+    return field.distance
+
+
+def is_flow_field_cached(map_: tcod.ecs.Entity, goal: Hashable, roots: NDArray[np.bool_]) -> bool:
+    """Return True if :any:`get_flow_field` would reuse a cached field instead of computing one."""
+    cache = map_.components.get(FlowFieldCache)
+    return cache is not None and cache.get(goal, map_.components.get(TerrainVersion, 0), roots) is not None
+
+
+def descend(distance: NDArray[np.int32], start: Location) -> NDArray[np.intc]:
+    """Return the ij path from `start` down a distance field, excluding `start` itself."""
+    return tcod.path.hillclimb2d(distance, start.ij, cardinal=True, diagonal=True)[1:]
+
+
+def _count_expanded(distance: NDArray[np.int32], goal: tuple[int, int]) -> int:
+    """Return the nodes an A* search resolved in `distance` has expanded.
+
+    If the goal was reached these are the nodes with a lower estimate than the path cost, which every A* search with
+    this heuristic expands, otherwise the search expanded every node it reached.
+    """
+    reached = distance != np.iinfo(distance.dtype).max
+    if not reached[goal]:
+        return int(np.count_nonzero(reached))
+    i, j = np.ogrid[: distance.shape[0], : distance.shape[1]]
+    di, dj = np.abs(i - goal[0]), np.abs(j - goal[1])
+    diagonal = np.minimum(di, dj)
+    estimate = distance.astype(np.int64) + 3 * diagonal + 2 * (np.maximum(di, dj) - diagonal)
+    return int(np.count_nonzero(reached & (estimate < distance[goal]))) + 1
+
+
+def find_path(
+    map_: tcod.ecs.Entity,
+    start: tuple[int, int],
+    goal: tuple[int, int],
+    *,
+    max_nodes: int = MAX_SEARCH_NODES,
+) -> NDArray[np.intc] | None:
+    """Return the ij path from `start` to `goal` excluding `start`, or None if no path was found within the budget.
+
+    This is an A* search which stops once `goal` is reached, occupied tiles cost more so that the path goes around
+    other actors where it can.
+    The search is limited to the bounding box of both points padded by a few tiles and is widened while it finds no
+    path.
+    A search can not expand more nodes than its window has tiles, so searching stops before the windows searched
+    would hold more than `max_nodes` tiles in total.
+    """
+    cost = get_path_cost(map_)
+    height, width = cost.shape
+    spent = 0
+    expanded = 0
+    collect_stats = PathStats in map_.registry[None].components
+    path = None
+    searched = False
+    for padding in _SEARCH_PADDING:
+        i0, j0 = max(0, min(start[0], goal[0]) - padding), max(0, min(start[1], goal[1]) - padding)
+        i1, j1 = min(height, max(start[0], goal[0]) + padding + 1), min(width, max(start[1], goal[1]) + padding + 1)
+        spent += (i1 - i0) * (j1 - j0)
+        if spent > max_nodes:
+            break
+        searched = True
+        pathfinder = tcod.path.Pathfinder(tcod.path.SimpleGraph(cost=cost[i0:i1, j0:j1], cardinal=2, diagonal=3))
+        pathfinder.add_root((start[0] - i0, start[1] - j0))
+        local_path = pathfinder.path_to((goal[0] - i0, goal[1] - j0))
+        if collect_stats:
+            expanded += _count_expanded(pathfinder.distance, (goal[0] - i0, goal[1] - j0))
+        if len(local_path) >= 2 or start == goal:  # noqa: PLR2004
+            path = local_path[1:] + np.array((i0, j0), dtype=np.intc)
+            break
+        if (i1 - i0, j1 - j0) == (height, width):
+            break  # The whole map was searched
+    if searched:
+        record_path_stats(map_.registry, PathStrategy.AStar, requests=1, expanded=expanded)
+    return path
@@ -0,0 +1,147 @@
+"""Background world generation.
+
+Caves are planned by :any:`plan_cave` in a pool of worker processes so that generating large maps does not stall the
+main loop.
+Workers only return a :any:`CavePlan` of arrays and spawn lists, the main process builds the entities from it which is
+fast compared to planning.
+The next world is planned ahead of time so that a new game usually starts instantly.
+"""
+
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from random import Random
+from typing import Any
+
+import attrs
+import tcod.ecs
+
+from game.map_gen import CaveConfig, CavePlan, plan_cave
+from game.world_init import new_world, world_cave_seed
+
+_progress_queue: Any = None
+"""Queue of (task_id, fraction) progress reports, set in worker processes."""
+
+
+def _init_worker(progress_queue: Any) -> None:  # noqa: ANN401
+    """Initialize a worker process."""
+    global _progress_queue  # noqa: PLW0603
+    _progress_queue = progress_queue
+
+
+def _report_progress(task_id: int, fraction: float) -> None:
+    """Report the progress of a task to the main process."""
+    _progress_queue.put((task_id, fraction))
+
+
+def _plan_cave_task(  # noqa: PLR0913
+    task_id: int, seed: int, width: int, height: int, orcs: int | None, config: CaveConfig | None
+) -> CavePlan:
+    """Plan a cave in a worker process."""
+    return plan_cave(seed, width, height, orcs, config, progress=lambda fraction: _report_progress(task_id, fraction))
+
+
+@attrs.define(eq=False)
+class PendingWorld:
+    """A world whose starting cave is being generated in the background."""
+
+    future: Future[CavePlan]
+    seed: int = attrs.field(kw_only=True)
+    """Seed of the world."""
+    kobolds: int = attrs.field(kw_only=True)
+    """Starting kobolds of the world."""
+    progress: float = 0.0
+    """Last reported fraction of the plan which is complete."""
+
+    def done(self) -> bool:
+        """Return True if the plan is ready."""
+        return self.future.done()
+
+    def result(self) -> CavePlan:
+        """Return the plan, blocking until it is ready."""
+        return self.future.result()
+
+    def build(self) -> tcod.ecs.Registry:
+        """Return the new world, blocking until its cave is ready."""
+        return new_world(seed=self.seed, kobolds=self.kobolds, plan=self.result())
+
+
+@attrs.define(eq=False)
+class Pregenerator:
+    """Generates worlds in a pool of worker processes.
+
+    The pool is started on first use.
+    """
+
+    width: int = 128
+    """Map width of new worlds."""
+    height: int = 128
+    """Map height of new worlds."""
+    orcs: int | None = None
+    """Orcs of new worlds, see :any:`plan_cave`."""
+    kobolds: int = 4
+    """Starting kobolds of new worlds."""
+    config: CaveConfig | None = None
+    """Cave parameters of new worlds."""
+    max_workers: int | None = None
+    """Number of worker processes, defaults to the number of CPUs."""
+    _executor: ProcessPoolExecutor | None = attrs.field(default=None, init=False)
+    _progress_queue: Any = attrs.field(default=None, init=False)
+    _task_ids: itertools.count[int] = attrs.field(factory=itertools.count, init=False)
+    _tasks: dict[int, PendingWorld] = attrs.field(factory=dict, init=False)
+    """Tasks which may still report progress."""
+    _next_world: PendingWorld | None = attrs.field(default=None, init=False)
+
+    def _submit(
+        self, seed: int, width: int, height: int, orcs: int | None, config: CaveConfig | None
+    ) -> tuple[int, Future[CavePlan]]:
+        """Submit a cave plan to the pool, return the task id and the future."""
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")  # Forking would copy the threads and SDL state of the game
+            self._progress_queue = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                self.max_workers, mp_context=context, initializer=_init_worker, initargs=(self._progress_queue,)
+            )
+        task_id = next(self._task_ids)
+        return task_id, self._executor.submit(_plan_cave_task, task_id, seed, width, height, orcs, config)
+
+    def prefetch_world(self) -> None:
+        """Start planning the next world if it is not already being planned."""
+        if self._next_world is not None:
+            return
+        seed = Random().getrandbits(64)
+        task_id, future = self._submit(world_cave_seed(seed), self.width, self.height, self.orcs, self.config)
+        self._tasks[task_id] = self._next_world = PendingWorld(future, seed=seed, kobolds=self.kobolds)
+
+    def take_world(self) -> PendingWorld:
+        """Return the next world, which may still be generating, and start planning the one after it."""
+        self.prefetch_world()
+        assert self._next_world is not None
+        pending, self._next_world = self._next_world, None
+        self.prefetch_world()
+        return pending
+
+    def poll(self) -> None:
+        """Update the progress of pending tasks."""
+        while self._progress_queue is not None:
+            try:
+                task_id, fraction = self._progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task_id in self._tasks:
+                self._tasks[task_id].progress = fraction
+        for task_id, pending in list(self._tasks.items()):
+            if pending.done():
+                pending.progress = 1.0
+                del self._tasks[task_id]
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, pending plans are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._next_world = None
+        self._tasks.clear()
@@ -2,21 +2,55 @@
 
 from __future__ import annotations
 
-from collections import defaultdict
-
+import numpy as np
 import tcod.camera
 import tcod.console
 import tcod.ecs
+from numpy.typing import NDArray
 
-from game.components import Graphic, Location, RoomTypeLayer, Shape, TilesLayer
-from game.tags import FacetOf, IsActor, IsItem, IsPlayer
+from game.components import GlyphLayer, Graphic, Location, RoomTypeLayer, Shape, TilesLayer
+from game.room import RoomType
+from game.spatial import get_spatial_index
+from game.tags import IsPlayer
 from game.tile import TileDB
 
+TREASURY_GLYPH = (ord("t"), (0x40, 0x40, 0x40))
+"""Glyph drawn over treasury tiles."""
+
+
+def _tile_glyphs(map_: tcod.ecs.Entity, region: tuple[slice, slice]) -> NDArray[np.void]:
+    """Return the terrain and room glyphs of a region of a map."""
+    tile_db = map_.registry[None].components[TileDB]
+    glyphs = np.empty_like(map_.components[TilesLayer][region], dtype=tcod.console.rgb_graphic)
+    glyphs[...] = tile_db.data[["ch", "fg", "bg"]][map_.components[TilesLayer][region]]
+    glyphs[["ch", "fg"]][map_.components[RoomTypeLayer][region] == RoomType.Treasury] = TREASURY_GLYPH
+    return glyphs
+
+
+def get_glyphs(map_: tcod.ecs.Entity) -> NDArray[np.void]:
+    """Return the glyph layer of a map, building it if it does not exist.
+
+    The returned array is kept up to date and must not be modified by the caller.
+    """
+    glyphs = map_.components.get(GlyphLayer)
+    if glyphs is None:
+        height, width = map_.components[Shape]
+        map_.components[GlyphLayer] = glyphs = _tile_glyphs(map_, (slice(0, height), slice(0, width)))
+    return glyphs
+
+
+def update_tile_glyph(pos: Location) -> None:
+    """Update the glyph layer after the tile or room at `pos` was changed."""
+    glyphs = pos.map.components.get(GlyphLayer)
+    if glyphs is None:
+        return  # Layer is built on demand later.
+    region = slice(pos.y, pos.y + 1), slice(pos.x, pos.x + 1)
+    glyphs[region] = _tile_glyphs(pos.map, region)
+
 
 def render_world(registry: tcod.ecs.Registry, console: tcod.console.Console) -> None:
     """Render the active scene onto the console."""
     (player,) = registry.Q.all_of(tags=[IsPlayer])
-    tile_db = registry[None].components[TileDB]
 
     player_pos = player.components[Location]
     map_ = player_pos.map
@@ -25,26 +59,25 @@ def render_world(registry: tcod.ecs.Registry, console: tcod.console.Console) ->
     screen_slice, world_slice = tcod.camera.get_slices(
         (console.height, console.width), map_.components[Shape], (camera_y, camera_x)
     )
-    console.rgb[screen_slice] = tile_db.data[["ch", "fg", "bg"]][map_.components[TilesLayer][world_slice]]
-    console.rgb[["ch", "fg"]][screen_slice][map_.components[RoomTypeLayer][world_slice] == 1] = (
-        ord("t"),
-        (0x40, 0x40, 0x40),
-    )
+    console.rgb[screen_slice] = get_glyphs(map_)[world_slice]
 
-    to_display = defaultdict[tuple[int, int], list[tuple[int, tcod.ecs.Entity]]](list)
-
-    for entity in registry.Q.all_of(components=[Graphic, Location]):
-        entity_pos = entity.components[Location]
-        x = entity_pos.x - camera_x
-        y = entity_pos.y - camera_y
-        if 0 <= x < console.width and 0 <= y < console.height:
-            order = 0
-            if FacetOf in entity.relation_tag:
-                order = 3
-            elif IsActor in entity.tags:
-                order = 2
-            elif IsItem in entity.tags:
-                order = 1
-            to_display[(y, x)].append((order, entity))
-    for yx, sprites in to_display.items():
-        console.rgb[["ch", "fg"]][yx] = max(sprites, key=lambda it: it[0])[1].components[Graphic].astuple()
+    index = get_spatial_index(map_)
+    slots = index.region_slots(world_slice)
+    graphics = []
+    for slot in slots.tolist():
+        entity = index.entities[slot]
+        assert entity is not None
+        graphics.append(entity.components.get(Graphic))
+    has_graphic = np.fromiter((graphic is not None for graphic in graphics), dtype=np.bool_, count=len(graphics))
+    if not has_graphic.any():
+        return
+    slots = slots[has_graphic]
+    ch = np.fromiter((graphic.ch for graphic in graphics if graphic is not None), dtype=np.intc, count=len(slots))
+    fg = np.array([graphic.fg for graphic in graphics if graphic is not None], dtype=np.uint8)
+    # Stable sort by descending kind so that the first sprite of each cell is the one drawn on top
+    order = np.argsort(-index.slot_kind[slots], kind="stable")
+    screen_i = index.slot_ij[slots[order], 0] - camera_y
+    screen_j = index.slot_ij[slots[order], 1] - camera_x
+    _, top = np.unique(screen_i * console.width + screen_j, return_index=True)
+    console.rgb["ch"][screen_i[top], screen_j[top]] = ch[order][top]
+    console.rgb["fg"][screen_i[top], screen_j[top]] = fg[order][top]
@@ -1,40 +1,951 @@
-"""Save and load functions."""
+"""Save and load functions.
+
+Saves use a versioned container format:
+
+- An 8 byte magic string, then the format version and the header size as little-endian uint32.
+- A JSON header describing the codec and the location of each section, and indexing the sites of the world.
+- Map layers such as :any:`TilesLayer` stored as raw uncompressed arrays aligned to 64 bytes,
+  these are memory-mapped copy-on-write when loaded.
+- One compressed section of columnar tables with the entities, components, tags, and relations of the registry.
+
+Derived components such as caches and cost layers are not saved, they are rebuilt on demand after loading.
+Position tags are also not saved, they are restored from the :any:`Location` components.
+Legacy pickled and xz compressed saves can still be loaded.
+
+Sites evicted by :any:`game.sites` are stored in their own files of the same format with the site as the first entity,
+the main save then only holds the site entity itself.
+
+A save can be followed by a journal, a file next to it with a header naming the save it belongs to and then a sequence
+of length-prefixed compressed deltas.
+Each delta holds the state of the entities which changed since the previous save and the changed chunks of the map
+layers, the deltas are applied in order when the save is loaded.
+"""
 
 from __future__ import annotations
 
+import bz2
+import contextlib
+import io
+import json
+import logging
 import lzma
 import pickle
+import struct
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, BinaryIO, Final, Literal
 
+import attrs
 import numpy as np
 import tcod.ecs
 from numpy.typing import NDArray
 
+from game.components import (
+    CHANGE_CHUNK_SIZE,
+    Changes,
+    ChangeSet,
+    EvictedAt,
+    GlyphLayer,
+    Location,
+    MoveCostLayer,
+    Name,
+    OccupancyLayer,
+    PathCostLayer,
+    PendingSiteWrite,
+    RoomTypeLayer,
+    SiteFile,
+    TilesLayer,
+    TransparencyLayer,
+)
+from game.fov import FOVCache
+from game.path_hierarchy import PathHierarchy
+from game.pathfinding import FlowFieldCache
+from game.spatial import SpatialIndex
+from game.stockpile import Stockpile
+from game.tags import IsSite
+from game.timesys import Ticket, TurnQueue, is_stale
+
+logger = logging.getLogger(__name__)
+
 SAVE_DIR = Path("saves")
-SAVE_PATH = SAVE_DIR / "save.sav.xz"
+SAVE_PATH = SAVE_DIR / "save.sav"
+LEGACY_SAVE_PATH = SAVE_DIR / "save.sav.xz"
+"""Save path used before the container format, loaded if there is no save at :any:`SAVE_PATH`."""
+LEGACY_SITE_NAME: Final = "Cave"
+"""Name given to the maps of saves from before sites, which only had the one cave."""
+SITE_DIR: Final = SAVE_DIR / "sites"
+"""Directory of evicted sites, site files are kept in the directory of this name next to their save."""
+
+MAGIC: Final = b"EDDSAVE\0"
+FORMAT_VERSION: Final = 1
+ALIGNMENT: Final = 64
+_PREFIX = struct.Struct("<8sII")
+
+type Codec = Literal["none", "zlib", "bz2", "lzma"]
+"""Compression codec of the table section."""
+
+LAYER_COMPONENTS: Final = (TilesLayer, RoomTypeLayer)
+"""Components stored as raw arrays."""
+
+DERIVED_COMPONENTS: Final = frozenset(
+    {
+        FlowFieldCache,
+        PathHierarchy,
+        FOVCache,
+        SpatialIndex,
+        Stockpile,
+        PendingSiteWrite,
+        MoveCostLayer,
+        OccupancyLayer,
+        PathCostLayer,
+        TransparencyLayer,
+        GlyphLayer,
+        Changes,
+    }
+)
+"""Components which are not saved since they are rebuilt when needed or only matter to the running game."""
+
+
+def _compress(data: bytes, codec: Codec, level: int) -> bytes:
+    match codec:
+        case "none":
+            return data
+        case "zlib":
+            return zlib.compress(data, level)
+        case "bz2":
+            return bz2.compress(data, level)
+        case "lzma":
+            return lzma.compress(data, preset=level)
+
+
+def _decompress(data: bytes, codec: Codec) -> bytes:
+    match codec:
+        case "none":
+            return data
+        case "zlib":
+            return zlib.decompress(data)
+        case "bz2":
+            return bz2.decompress(data)
+        case "lzma":
+            return lzma.decompress(data)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class _TablePickler(pickle.Pickler):
+    """Pickles entities of one registry as indexes into the entity table."""
+
+    def __init__(self, file: io.BytesIO, registry: tcod.ecs.Registry) -> None:
+        super().__init__(file, protocol=5)
+        self.registry = registry
+        self.entity_index: dict[tcod.ecs.Entity, int] = {}
+
+    def index_of(self, entity: tcod.ecs.Entity) -> int:
+        """Return the table index of an entity, adding it to the table if it is new."""
+        return self.entity_index.setdefault(entity, len(self.entity_index))
+
+    def persistent_id(self, obj: object) -> object:
+        """Replace entities of this registry with their index."""
+        if isinstance(obj, tcod.ecs.Entity) and obj.registry is self.registry:
+            return self.index_of(obj)
+        if obj is self.registry:
+            return "registry"
+        return None
+
+
+class _TableUnpickler(pickle.Unpickler):
+    """Resolves entity indexes written by :any:`_TablePickler`."""
+
+    def __init__(self, file: io.BytesIO, registry: tcod.ecs.Registry, entities: list[tcod.ecs.Entity]) -> None:
+        super().__init__(file)
+        self.registry = registry
+        self.entities = entities
+
+    def persistent_load(self, pid: object) -> object:
+        """Return the entity or registry of a persistent ID."""
+        if pid == "registry":
+            return self.registry
+        assert isinstance(pid, int)
+        return self.entities[pid]
+
+
+class _SitePickler(_TablePickler):
+    """Pickles the entities of one site, the site itself is always the first entity of the table."""
+
+    def __init__(self, file: io.BytesIO, site: tcod.ecs.Entity, members: set[tcod.ecs.Entity]) -> None:
+        super().__init__(file, site.registry)
+        self.members = members
+        self.index_of(site)
+
+    def persistent_id(self, obj: object) -> object:
+        """Refuse references to anonymous entities outside of the site, they can not be restored."""
+        if (
+            isinstance(obj, tcod.ecs.Entity)
+            and type(obj.uid) is object
+            and obj not in self.members
+            and obj not in self.entity_index
+        ):
+            msg = f"{obj} is referenced by a site but is not part of it."
+            raise pickle.PicklingError(msg)
+        return super().persistent_id(obj)
+
+
+@attrs.define(frozen=True)
+class _LocationColumn:
+    """Column of locations stored as coordinate arrays and map entity indexes."""
+
+    x: NDArray[np.int32]
+    y: NDArray[np.int32]
+    map: NDArray[np.int32]
+
+
+type _Column = NDArray[Any] | _LocationColumn | list[Any]
+
+
+def _to_column(values: list[Any], pickler: _TablePickler) -> _Column:
+    """Return values as arrays if they are all of one scalar type or are all locations."""
+    for scalar_type in (bool, int, float):
+        if all(type(value) is scalar_type for value in values):
+            try:
+                return np.asarray(values, dtype=scalar_type)
+            except OverflowError:
+                return values
+    if all(type(value) is Location and value.map.registry is pickler.registry for value in values):
+        return _LocationColumn(
+            x=np.asarray([pos.x for pos in values], dtype=np.int32),
+            y=np.asarray([pos.y for pos in values], dtype=np.int32),
+            map=np.asarray([pickler.index_of(pos.map) for pos in values], dtype=np.int32),
+        )
+    return values
+
+
+def _from_column(column: _Column, entities: list[tcod.ecs.Entity]) -> list[Any]:
+    """Return the values of a column."""
+    if isinstance(column, np.ndarray):
+        return column.tolist()  # type: ignore[no-any-return]
+    if isinstance(column, _LocationColumn):
+        return [
+            Location(x, y, entities[map_index])
+            for x, y, map_index in zip(column.x.tolist(), column.y.tolist(), column.map.tolist(), strict=True)
+        ]
+    return column
+
+
+def _encode_tables(
+    pickler: _TablePickler, state: dict[str, Any] | None = None
+) -> tuple[dict[str, Any], list[NDArray[Any]]]:
+    """Return the columnar tables of a registry and its raw layers, entities are indexed by `pickler`.
+
+    `state` is the registry state to encode and defaults to the whole registry.
+    """
+    if state is None:
+        state = pickler.registry.__getstate__()
+    layers: list[NDArray[Any]] = []
+    components: dict[object, tuple[NDArray[np.int32], _Column]] = {}
+    layer_columns: dict[object, tuple[list[int], list[int]]] = {}
+    for key, by_entity in state["_components_by_type"].items():
+        if key in DERIVED_COMPONENTS:
+            continue
+        indexes = np.fromiter(map(pickler.index_of, by_entity), dtype=np.int32, count=len(by_entity))
+        if key in LAYER_COMPONENTS:
+            layer_columns[key] = (indexes.tolist(), list(range(len(layers), len(layers) + len(by_entity))))
+            layers += (np.array(layer, order="C") for layer in by_entity.values())
+            continue
+        components[key] = (indexes, _to_column(list(by_entity.values()), pickler))
+    tags: defaultdict[object, list[int]] = defaultdict(list)
+    for entity, entity_tags in state["_tags_by_entity"].items():
+        for tag in entity_tags:
+            if isinstance(tag, Location):
+                continue  # Position tags are restored from the Location component
+            tags[tag].append(pickler.index_of(entity))
+    tables = {
+        "components": components,
+        "layers": layer_columns,
+        "tags": {tag: np.asarray(indexes, dtype=np.int32) for tag, indexes in tags.items()},
+        "relation_tags": state["_relation_tags_by_entity"],
+        "relation_components": state["_relation_components_by_entity"],
+        "names": state["_names_by_name"],
+    }
+    return tables, layers
+
+
+@attrs.define(eq=False)
+class WorldSnapshot:
+    """Serialized copy of a world which no longer references the registry and can be written from any thread."""
+
+    tables: bytes
+    """Uncompressed entity table and columnar tables."""
+    layers: list[NDArray[Any]]
+    """Copies of the map layers."""
+    save_id: str = attrs.field(factory=lambda: uuid.uuid4().hex)
+    """Unique ID of this save, a journal is only applied to the save it was started from."""
+    sites: list[dict[str, Any]] = attrs.field(factory=list)
+    """Index of the sites of the world, see :any:`read_site_index`."""
+    taken_at: float = attrs.field(factory=time.time)
+    """Wall clock time the snapshot was taken."""
+
+
+def _entity_table(pickler: _TablePickler, start: int = 0) -> bytes:
+    """Return the pickled entity count and the UIDs of named entities indexed from `start` onward.
+
+    The entity table is only complete after pickling, component values can reference entities not yet indexed.
+    """
+    entities = list(pickler.entity_index)
+    named_uids = {i: entity.uid for i, entity in enumerate(entities[start:], start) if type(entity.uid) is not object}
+    return pickle.dumps((len(entities), named_uids), protocol=5)
+
+
+def _snapshot_tables(registry: tcod.ecs.Registry) -> tuple[WorldSnapshot, _TablePickler, dict[str, Any]]:
+    """Return a snapshot of a world along with the pickler and tables it was encoded with."""
+    buffer = io.BytesIO()
+    pickler = _TablePickler(buffer, registry)
+    tables, layers = _encode_tables(pickler)
+    pickler.dump(tables)
+    sites = [
+        {
+            "name": site.components.get(Name),
+            "file": site.components.get(SiteFile) if EvictedAt in site.components else None,
+        }
+        for site in registry.Q.all_of(tags=[IsSite])
+    ]
+    return WorldSnapshot(_entity_table(pickler) + buffer.getvalue(), layers, sites=sites), pickler, tables
+
+
+def snapshot_world(registry: tcod.ecs.Registry) -> WorldSnapshot:
+    """Return a snapshot of a world, this must be called from the thread which owns the registry."""
+    return _snapshot_tables(registry)[0]
+
+
+def write_snapshot(snapshot: WorldSnapshot, path: Path = SAVE_PATH, *, codec: Codec = "zlib", level: int = 6) -> None:
+    """Compress and write a snapshot to `path`.
+
+    The save is written to a temporary file first which then atomically replaces `path`.
+    """
+    table_data = _compress(snapshot.tables, codec, level)
+    offsets = []
+    offset = 0
+    for layer in snapshot.layers:
+        offsets.append(offset)
+        offset = _align(offset + layer.nbytes)
+    sections = [
+        {"offset": layer_offset, "dtype": layer.dtype.str, "shape": layer.shape}
+        for layer_offset, layer in zip(offsets, snapshot.layers, strict=True)
+    ]
+    header = json.dumps(
+        {
+            "codec": codec,
+            "level": level,
+            "save_id": snapshot.save_id,
+            "sites": snapshot.sites,
+            "layers": sections,
+            "tables": {"offset": offset, "size": len(table_data)},
+        }
+    ).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for layer_offset, layer in zip(offsets, snapshot.layers, strict=True):
+            f.seek(data_start + layer_offset)
+            f.write(layer.data)
+        f.seek(data_start + offset)
+        f.write(table_data)
+    tmp_path.replace(path)
+    journal_path(path).unlink(missing_ok=True)  # Any journal belonged to the replaced save
+
+
+def save_world(registry: tcod.ecs.Registry, path: Path = SAVE_PATH, *, codec: Codec = "zlib", level: int = 6) -> None:
+    """Save the provided world to disk.
+
+    `codec` and `level` configure the compression of the entity tables, map layers are always stored uncompressed so
+    that they can be memory-mapped.
+    """
+    _detach_layers(registry, path)
+    snapshot = snapshot_world(registry)
+    write_snapshot(snapshot, path, codec=codec, level=level)
+    remove_orphan_site_files(snapshot, path)
+
+
+def remove_orphan_site_files(snapshot: WorldSnapshot, path: Path) -> list[Path]:
+    """Delete the older site files next to the save at `path` which `snapshot` does not reference.
+
+    Returns the deleted files.
+    This must be called once `snapshot` has replaced the save and its journal.
+    Newer files are kept as they may belong to sites evicted after the snapshot was taken.
+    """
+    site_dir = path.parent / SITE_DIR.name
+    if not site_dir.is_dir():
+        return []
+    referenced = {Path(site["file"]).resolve() for site in snapshot.sites if site["file"] is not None}
+    removed = []
+    for file in site_dir.glob("*.sav"):
+        if file.resolve() not in referenced and file.stat().st_mtime < snapshot.taken_at:
+            file.unlink(missing_ok=True)
+            removed.append(file)
+    return removed
+
+
+def snapshot_site(site: tcod.ecs.Entity, members: set[tcod.ecs.Entity]) -> WorldSnapshot:
+    """Return a snapshot of the map of `site` and its `members`, this must be called from the thread owning the registry.
+
+    Anonymous entities outside of the site can not be referenced by the saved entities.
+    """
+    entities = members | {site}
+    state = site.registry.__getstate__()
+    site_state = {
+        "_components_by_type": {
+            key: site_components
+            for key, by_entity in state["_components_by_type"].items()
+            if (site_components := {entity: value for entity, value in by_entity.items() if entity in entities})
+        },
+        "_tags_by_entity": {entity: tags for entity, tags in state["_tags_by_entity"].items() if entity in entities},
+        "_relation_tags_by_entity": {
+            entity: relations for entity, relations in state["_relation_tags_by_entity"].items() if entity in entities
+        },
+        "_relation_components_by_entity": {
+            entity: relations
+            for entity, relations in state["_relation_components_by_entity"].items()
+            if entity in entities
+        },
+        "_names_by_name": {name: entity for name, entity in state["_names_by_name"].items() if entity in entities},
+    }
+    buffer = io.BytesIO()
+    pickler = _SitePickler(buffer, site, entities)
+    tables, layers = _encode_tables(pickler, site_state)
+    pickler.dump(tables)
+    return WorldSnapshot(_entity_table(pickler) + buffer.getvalue(), layers)
+
+
+def save_site(
+    site: tcod.ecs.Entity,
+    members: set[tcod.ecs.Entity],
+    path: Path,
+    *,
+    codec: Codec = "zlib",
+    level: int = 6,
+) -> None:
+    """Save the map of `site` and its `members` to their own file, see :any:`load_site_state`."""
+    write_snapshot(snapshot_site(site, members), path, codec=codec, level=level)
+
 
+JOURNAL_MAGIC: Final = b"EDDJRNL\0"
+JOURNAL_VERSION: Final = 2
+"""Version of the delta format, journals of other versions are ignored."""
+_JOURNAL_PREFIX = struct.Struct("<8sI")
+_RECORD_PREFIX = struct.Struct("<I")
 
-def save_world(registry: tcod.ecs.Registry) -> None:
-    """Save the provided world to disk."""
-    data = pickle.dumps(registry, protocol=5)
-    data = lzma.compress(data)
-    SAVE_DIR.mkdir(exist_ok=True)
-    SAVE_PATH.write_bytes(data)
 
+def journal_path(path: Path) -> Path:
+    """Return the path of the journal of the save at `path`."""
+    return path.with_name(path.name + ".journal")
 
-def load_world() -> tcod.ecs.Registry:
-    """Return th perviously saved world."""
-    data = SAVE_PATH.read_bytes()
+
+@attrs.define(frozen=True)
+class _EntityDelta:
+    """Journaled state of one changed entity, this replaces all of its saved state."""
+
+    components: dict[object, Any]
+    layers: dict[object, NDArray[Any] | None]
+    """Map layers of the entity, None for layers which are unchanged other than their patched chunks."""
+    tags: set[object]
+    relation_tags: dict[object, set[tcod.ecs.Entity]]
+    relation_components: dict[object, dict[tcod.ecs.Entity, Any]]
+    name: object
+
+
+class SaveJournal:
+    """Saves a world as a full snapshot followed by a journal of deltas.
+
+    After the first full snapshot each save only appends what changed since the previous save to the journal:
+    the state of each entity marked by :any:`mark_changed` and the chunks of map layers marked by
+    :any:`mark_tile_changed`, which are tracked in the :any:`Changes` of the global entity.
+    Positions and tickets are marked by their component callbacks.
+    The global entity is in every delta since the turn queue and the RNG change in place every turn.
+    Changes which were not marked are only saved by the next full snapshot.
+    The journal is compacted into a new full snapshot after every `max_deltas` deltas.
+    """
+
+    __slots__ = (
+        "_entity_count",
+        "_entity_index",
+        "_layers",
+        "_registry",
+        "_save_id",
+        "codec",
+        "deltas",
+        "level",
+        "max_deltas",
+        "path",
+    )
+
+    def __init__(self, path: Path = SAVE_PATH, *, max_deltas: int = 16, codec: Codec = "zlib", level: int = 6) -> None:
+        """Initialize a journal for the save at `path`, the first save made with it is always a full snapshot."""
+        self.path = path
+        self.max_deltas = max_deltas
+        self.codec: Codec = codec
+        self.level = level
+        self.deltas = 0
+        """Number of deltas journaled since the last full snapshot."""
+        self._registry: tcod.ecs.Registry | None = None
+        self._save_id: str | None = None
+        self._entity_index: dict[tcod.ecs.Entity, int] = {}
+        self._entity_count = 0
+        self._layers: dict[tuple[object, int], NDArray[Any]] = {}
+        """Journaled map layers by key and entity index, a different array means the layer was replaced."""
+
+    def save(self, registry: tcod.ecs.Registry) -> None:
+        """Save `registry` now."""
+        self.snapshot(registry)()
+
+    def snapshot(self, registry: tcod.ecs.Registry) -> Callable[[], None]:
+        """Record the changes to `registry` since the last save and return a function which writes them.
+
+        The returned function does not access the registry and may be called from another thread, but the writes of
+        a journal must be done in order.
+        A full snapshot is taken for the first save of a registry, after a failed write, and after `max_deltas` deltas.
+        """
+        _detach_layers(registry, self.path)
+        changes = registry[None].components.get(Changes)
+        if registry is not self._registry or self._save_id is None or self.deltas >= self.max_deltas or changes is None:
+            return self._snapshot_full(registry)
+        return self._snapshot_delta(registry, changes)
+
+    def _snapshot_full(self, registry: tcod.ecs.Registry) -> Callable[[], None]:
+        """Take a full snapshot and reset the journal to it."""
+        snapshot, pickler, _ = _snapshot_tables(registry)
+        registry[None].components[Changes] = ChangeSet()
+        self._registry = registry
+        self._save_id = snapshot.save_id
+        self.deltas = 0
+        self._entity_index = pickler.entity_index
+        self._entity_count = len(self._entity_index)
+        self._layers = {
+            (key, pickler.index_of(entity)): entity.components[key]
+            for key in LAYER_COMPONENTS
+            for entity in registry.Q.all_of(components=[key])
+        }
+
+        def write() -> None:
+            with self._invalidate_on_error():
+                write_snapshot(snapshot, self.path, codec=self.codec, level=self.level)
+                header = json.dumps(
+                    {"save_id": snapshot.save_id, "codec": self.codec, "version": JOURNAL_VERSION}
+                ).encode()
+                tmp_path = self.path.with_name(self.path.name + ".journal.tmp")
+                tmp_path.write_bytes(_JOURNAL_PREFIX.pack(JOURNAL_MAGIC, len(header)) + header)
+                tmp_path.replace(journal_path(self.path))
+            remove_orphan_site_files(snapshot, self.path)
+
+        return write
+
+    def _snapshot_delta(self, registry: tcod.ecs.Registry, changes: ChangeSet) -> Callable[[], None]:
+        """Record the entities and map chunks which changed since the last save as a delta."""
+        registry[None].components[Changes] = ChangeSet()
+        buffer = io.BytesIO()
+        pickler = _TablePickler(buffer, registry)
+        pickler.entity_index = self._entity_index
+        entities = {}
+        for entity in (registry[None], *changes.entities):
+            i = pickler.index_of(entity)
+            entities[i] = self._entity_delta(entity, i)
+        patched = {(key, i) for i, delta in entities.items() for key, layer in delta.layers.items() if layer is None}
+        patches = [
+            (key, i, y, x, self._layers[key, i][y : y + CHANGE_CHUNK_SIZE, x : x + CHANGE_CHUNK_SIZE])
+            for i, y, x in ((pickler.index_of(map_), y, x) for map_, y, x in changes.chunks)
+            for key in LAYER_COMPONENTS
+            if (key, i) in patched
+        ]
+        pickler.dump({"entities": entities, "patches": patches})
+        record = _entity_table(pickler, self._entity_count) + buffer.getvalue()
+        self._entity_count = len(self._entity_index)
+        self.deltas += 1
+        save_id = self._save_id
+
+        def write() -> None:
+            with self._invalidate_on_error():
+                data = _compress(record, self.codec, self.level)
+                with journal_path(self.path).open("r+b") as f:
+                    magic, header_size = _JOURNAL_PREFIX.unpack(f.read(_JOURNAL_PREFIX.size))
+                    if magic != JOURNAL_MAGIC or json.loads(f.read(header_size))["save_id"] != save_id:
+                        msg = f"Journal {journal_path(self.path)} no longer belongs to this save."
+                        raise ValueError(msg)
+                    f.seek(0, io.SEEK_END)
+                    f.write(_RECORD_PREFIX.pack(len(data)) + data)
+
+        return write
+
+    def _entity_delta(self, entity: tcod.ecs.Entity, index: int) -> _EntityDelta:
+        """Return the current state of an entity, layers are only included whole if they were replaced."""
+        components: dict[object, Any] = {}
+        layers: dict[object, NDArray[Any] | None] = {}
+        for key, value in entity.components(traverse=()).items():
+            if key in DERIVED_COMPONENTS:
+                continue
+            if key in LAYER_COMPONENTS:
+                assert isinstance(value, np.ndarray)
+                layers[key] = None if self._layers.get((key, index)) is value else value
+                self._layers[key, index] = value
+                continue
+            components[key] = value
+        for key in LAYER_COMPONENTS:
+            if key not in layers:
+                self._layers.pop((key, index), None)
+        return _EntityDelta(
+            components=components,
+            layers=layers,
+            tags={tag for tag in entity.tags(traverse=()) if not isinstance(tag, Location)},
+            relation_tags={tag: set(targets) for tag, targets in entity.relation_tags_many(traverse=()).items()},
+            relation_components={
+                key: dict(by_target) for key, by_target in entity.relation_components(traverse=()).items()
+            },
+            name=entity.name,
+        )
+
+    @contextlib.contextmanager
+    def _invalidate_on_error(self) -> Iterator[None]:
+        """Make the next save a full snapshot if a write fails, the journal can not be trusted after that."""
+        try:
+            yield
+        except BaseException:
+            self._save_id = None
+            raise
+
+
+class Autosaver:
+    """Periodically saves a world in the background.
+
+    Saves are journaled by a :any:`SaveJournal`, so most autosaves only append the changes since the previous one.
+    Only the snapshot is taken on the calling thread, compressing and writing the save is done by a worker thread.
+    """
+
+    __slots__ = ("_executor", "_pending", "interval", "journal", "last_save")
+
+    def __init__(
+        self,
+        path: Path = SAVE_PATH,
+        interval: float = 300,
+        *,
+        max_deltas: int = 16,
+        codec: Codec = "zlib",
+        level: int = 6,
+    ) -> None:
+        """Initialize an autosaver which saves to `path` every `interval` seconds.
+
+        A full save is written after every `max_deltas` journaled saves.
+        """
+        self.journal = SaveJournal(path, max_deltas=max_deltas, codec=codec, level=level)
+        self.interval = interval
+        self.last_save = time.monotonic()
+        """Monotonic time of the last autosave."""
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="autosave")
+        self._pending: Future[None] | None = None
+
+    def update(self, registry: tcod.ecs.Registry) -> bool:
+        """Start an autosave if one is due and the previous one has finished, return True if a save was started."""
+        if self._pending is not None:
+            if not self._pending.done():
+                return False
+            self._check_pending()
+        if time.monotonic() - self.last_save < self.interval:
+            return False
+        self.save(registry)
+        return True
+
+    def save(self, registry: tcod.ecs.Registry) -> None:
+        """Snapshot `registry` now and write it in the background."""
+        self.wait()
+        write = self.journal.snapshot(registry)
+        self.last_save = time.monotonic()
+        self._pending = self._executor.submit(write)
+
+    def submit(self, write: Callable[[], None]) -> Future[None]:
+        """Run `write` on the worker thread after the writes already submitted, such as the file of an evicted site.
+
+        Failures are logged and also reported by the returned future.
+        """
+        future = self._executor.submit(write)
+        future.add_done_callback(_log_write_error)
+        return future
+
+    def wait(self) -> None:
+        """Block until any pending save is written."""
+        if self._pending is not None:
+            self._pending.exception()
+            self._check_pending()
+
+    def _check_pending(self) -> None:
+        """Log the result of the finished save."""
+        assert self._pending is not None
+        error = self._pending.exception()
+        self._pending = None
+        if error is not None:
+            logger.error("Autosave to %s failed.", self.journal.path, exc_info=error)
+        else:
+            logger.info("Autosaved to %s, %i deltas journaled.", self.journal.path, self.journal.deltas)
+
+    def shutdown(self) -> None:
+        """Wait for any pending save and stop the worker thread."""
+        self.wait()
+        self._executor.shutdown()
+
+
+def _log_write_error(future: Future[None]) -> None:
+    """Log the error of a failed background write."""
+    if not future.cancelled() and (error := future.exception()) is not None:
+        logger.error("Background write failed.", exc_info=error)
+
+
+def _detach_layers(registry: tcod.ecs.Registry, path: Path) -> None:
+    """Copy any layers memory-mapped from `path` into memory so that the file can be replaced."""
+    for key in LAYER_COMPONENTS:
+        for entity in registry.Q.all_of(components=[key]):
+            layer = entity.components[key]
+            if (
+                isinstance(layer, np.memmap)
+                and layer.filename is not None
+                and Path(layer.filename).resolve() == path.resolve()
+            ):
+                entity.components[key] = np.array(layer)
+
+
+def _read_header(f: BinaryIO) -> tuple[dict[str, Any], int]:
+    """Return the header of a container and the offset of its data."""
+    magic, version, header_size = _PREFIX.unpack(f.read(_PREFIX.size))
+    assert magic == MAGIC
+    if version > FORMAT_VERSION:
+        msg = f"Save format version {version} is newer than the supported version {FORMAT_VERSION}."
+        raise ValueError(msg)
+    return json.loads(f.read(header_size)), _align(_PREFIX.size + header_size)
+
+
+def read_site_index(path: Path = SAVE_PATH) -> list[dict[str, Any]]:
+    """Return the index of sites from the header of a save without loading it.
+
+    Each site has a ``"name"`` and a ``"file"`` which is None for sites stored in the save itself.
+    """
+    with path.open("rb") as f:
+        header, _ = _read_header(f)
+    return header.get("sites", [])  # type: ignore[no-any-return]
+
+
+def _read_container(
+    path: Path, registry: tcod.ecs.Registry, *, mmap: bool, entities: Sequence[tcod.ecs.Entity] = ()
+) -> tuple[dict[str, Any], list[tcod.ecs.Entity], dict[str, Any]]:
+    """Return the header, entity table, and decoded registry state of a container.
+
+    The first entries of the entity table can be bound to existing `entities`.
+    """
+    with path.open("rb") as f:
+        header, data_start = _read_header(f)
+        f.seek(data_start + header["tables"]["offset"])
+        table_data = _decompress(f.read(header["tables"]["size"]), header["codec"])
+
+    layers: list[NDArray[Any]] = []
+    for section in header["layers"]:
+        dtype, shape, offset = np.dtype(section["dtype"]), tuple(section["shape"]), data_start + section["offset"]
+        if mmap:
+            layers.append(np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape))
+        else:
+            with path.open("rb") as f:
+                f.seek(offset)
+                layers.append(np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape))
+
+    table_file = io.BytesIO(table_data)
+    entity_count, named_uids = pickle.load(table_file)  # noqa: S301
+    table = [
+        *entities,
+        *(tcod.ecs.Entity(registry, named_uids.get(i, object)) for i in range(len(entities), entity_count)),
+    ]
+    tables = _TableUnpickler(table_file, registry, table).load()
+
+    components_by_type: dict[object, dict[tcod.ecs.Entity, Any]] = {}
+    for key, (indexes, column) in tables["components"].items():
+        values = _from_column(column, table)
+        components_by_type[key] = {table[i]: value for i, value in zip(indexes.tolist(), values, strict=True)}
+    for key, (indexes, layer_indexes) in tables["layers"].items():
+        components_by_type[key] = {table[i]: layers[j] for i, j in zip(indexes, layer_indexes, strict=True)}
+    tags_by_entity: defaultdict[tcod.ecs.Entity, set[object]] = defaultdict(set)
+    for tag, indexes in tables["tags"].items():
+        for i in indexes.tolist():
+            tags_by_entity[table[i]].add(tag)
+    state = {
+        "_components_by_type": components_by_type,
+        "_tags_by_entity": tags_by_entity,
+        "_relation_tags_by_entity": tables["relation_tags"],
+        "_relation_components_by_entity": tables["relation_components"],
+        "_names_by_name": tables["names"],
+    }
+    return header, table, state
+
+
+def _load_container(path: Path, *, mmap: bool) -> tcod.ecs.Registry:
+    """Load a world from the container format."""
+    registry = tcod.ecs.Registry.__new__(tcod.ecs.Registry)
+    header, entities, state = _read_container(path, registry, mmap=mmap)
+    deltas = _apply_journal(journal_path(path), header.get("save_id"), registry, entities, state)
+    for entity, pos in state["_components_by_type"].get(Location, {}).items():
+        state["_tags_by_entity"][entity].add(pos)
+    registry.__setstate__(state)
+    if deltas:
+        _relink_tickets(registry)
+    return registry
+
+
+def load_site_state(site: tcod.ecs.Entity, path: Path) -> dict[str, Any]:
+    """Return the registry state saved by :any:`save_site`, the state is not added to the registry.
+
+    Layers are read into memory since the site file is replaced when the site is saved again.
+    """
+    _, _, state = _read_container(path, site.registry, mmap=False, entities=[site])
+    return state
+
+
+def _apply_journal(
+    path: Path,
+    save_id: str | None,
+    registry: tcod.ecs.Registry,
+    entities: list[tcod.ecs.Entity],
+    state: dict[str, Any],
+) -> int:
+    """Apply the deltas of the journal at `path` to a registry state, return the number of deltas applied.
+
+    The journal is ignored if it was started from a different save, a truncated final delta is also ignored.
+    """
+    if save_id is None or not path.exists():
+        return 0
+    data = path.read_bytes()
+    magic, header_size = _JOURNAL_PREFIX.unpack_from(data)
+    if magic != JOURNAL_MAGIC:
+        msg = f"{path} is not a save journal."
+        raise ValueError(msg)
+    header = json.loads(data[_JOURNAL_PREFIX.size : _JOURNAL_PREFIX.size + header_size])
+    if header["save_id"] != save_id:
+        logger.warning("Ignoring journal %s which was started from a different save.", path)
+        return 0
+    if header.get("version") != JOURNAL_VERSION:
+        logger.warning("Ignoring journal %s which was written in another format.", path)
+        return 0
+    offset = _JOURNAL_PREFIX.size + header_size
+    deltas = 0
+    while offset + _RECORD_PREFIX.size <= len(data):
+        (size,) = _RECORD_PREFIX.unpack_from(data, offset)
+        offset += _RECORD_PREFIX.size
+        if offset + size > len(data):
+            logger.warning("Ignoring the truncated last delta of journal %s.", path)
+            break
+        _apply_delta(io.BytesIO(_decompress(data[offset : offset + size], header["codec"])), registry, entities, state)
+        offset += size
+        deltas += 1
+    return deltas
+
+
+def _apply_delta(
+    file: io.BytesIO, registry: tcod.ecs.Registry, entities: list[tcod.ecs.Entity], state: dict[str, Any]
+) -> None:
+    """Apply one journaled delta to a registry state."""
+    entity_count, named_uids = pickle.load(file)  # noqa: S301
+    entities += (tcod.ecs.Entity(registry, named_uids.get(i, object)) for i in range(len(entities), entity_count))
+    delta = _TableUnpickler(file, registry, entities).load()
+    for i, entity_delta in delta["entities"].items():
+        _apply_entity_delta(entities[i], entity_delta, state)
+    components_by_type: dict[object, dict[tcod.ecs.Entity, Any]] = state["_components_by_type"]
+    for key, i, y, x, chunk in delta["patches"]:
+        components_by_type[key][entities[i]][y : y + chunk.shape[0], x : x + chunk.shape[1]] = chunk
+
+
+def _apply_entity_delta(entity: tcod.ecs.Entity, delta: _EntityDelta, state: dict[str, Any]) -> None:
+    """Replace the state of an entity in a registry state with its journaled state."""
+    _apply_entity_components(entity, delta, state["_components_by_type"])
+    for state_key, value in (
+        ("_tags_by_entity", delta.tags),
+        ("_relation_tags_by_entity", delta.relation_tags),
+        ("_relation_components_by_entity", delta.relation_components),
+    ):
+        if value:
+            state[state_key][entity] = value
+        else:
+            state[state_key].pop(entity, None)
+    names: dict[object, tcod.ecs.Entity] = state["_names_by_name"]
+    for name in [name for name, named in names.items() if named is entity]:
+        del names[name]
+    if delta.name is not None:
+        names[delta.name] = entity
+
+
+def _apply_entity_components(
+    entity: tcod.ecs.Entity, delta: _EntityDelta, components_by_type: dict[object, dict[tcod.ecs.Entity, Any]]
+) -> None:
+    """Replace the components of an entity with its journaled components, patched layers are kept."""
+    for key in list(components_by_type):
+        by_entity = components_by_type[key]
+        if entity not in by_entity or (key in delta.layers and delta.layers[key] is None):
+            continue
+        del by_entity[entity]
+        if not by_entity:
+            del components_by_type[key]
+    for key, value in delta.components.items():
+        components_by_type.setdefault(key, {})[entity] = value
+    for key, layer in delta.layers.items():
+        if layer is not None:
+            components_by_type.setdefault(key, {})[entity] = layer
+
+
+def _relink_tickets(registry: tcod.ecs.Registry) -> None:
+    """Make the turn queue hold the same ticket objects as their entities.
+
+    Tickets and the queue can be restored from different deltas as equal but separate objects,
+    while the queue compares tickets by identity.
+    """
+    queue = registry[None].components.get(TurnQueue)
+    if queue is None:
+        return
+    for i, ticket in enumerate(queue.heap):
+        held = ticket.entity.components.get(Ticket)
+        if held == ticket:
+            queue.heap[i] = held
+
+
+def _load_legacy(path: Path) -> tcod.ecs.Registry:
+    """Load a world saved as an xz compressed pickle."""
+    data = path.read_bytes()
     data = lzma.decompress(data)
     obj = pickle.loads(data)  # noqa: S301
     assert isinstance(obj, tcod.ecs.Registry)
 
-    # Migrate old types
+    # Migrate old types, these only exist in legacy saves
     for old_component, new_component in [
         (("TilesLayer", np.ndarray[tuple[int, ...], np.dtype[np.uint8]]), ("TilesLayer", NDArray[np.uint8])),
         (("RoomTypeLayer", np.ndarray[tuple[int, ...], np.dtype[np.uint8]]), ("RoomTypeLayer", NDArray[np.uint8])),
     ]:
         for entity in list(obj.Q.all_of(components=[old_component])):
             entity.components[new_component] = entity.components.pop(old_component)
+    old_queue = obj[None].components.pop(("TurnQueue", list[Ticket]), None)
+    if old_queue is not None:
+        obj[None].components[TurnQueue] = TurnQueue(ticket for ticket in old_queue if not is_stale(ticket))
+    for map_ in list(obj.Q.all_of(components=[TilesLayer]).none_of(tags=[IsSite])):
+        map_.tags.add(IsSite)  # Maps were not sites yet
+        map_.components.setdefault(Name, LEGACY_SITE_NAME)
 
     return obj
+
+
+def load_world(path: Path = SAVE_PATH, *, mmap: bool = True) -> tcod.ecs.Registry:
+    """Return th perviously saved world.
+
+    If `mmap` is True then map layers are memory-mapped copy-on-write instead of being read into memory.
+    """
+    if path == SAVE_PATH and not path.exists() and LEGACY_SAVE_PATH.exists():
+        path = LEGACY_SAVE_PATH
+    with path.open("rb") as f:
+        is_container = f.read(len(MAGIC)) == MAGIC
+    return _load_container(path, mmap=mmap) if is_container else _load_legacy(path)
@@ -0,0 +1,236 @@
+"""Coarse simulation of evicted sites.
+
+While a site is evicted only a :any:`SiteSummary` of it is kept in the registry.
+The summary is advanced in large steps using aggregate rates for hauling gold and for battles between factions instead
+of simulating each actor.
+Only actors which were in contact with an enemy when the site was evicted fight, the others keep to their own work.
+When the site is loaded again the outcome is applied to its actors and items, which then continue at full fidelity.
+"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Iterable
+from random import Random
+from typing import Final
+
+import attrs
+import numpy as np
+import tcod.ecs
+
+from game.combat import kill
+from game.components import HP, Gold, GoldVersion, Location, RoomTypeLayer, SightRadius, Str
+from game.faction import Faction, is_enemy
+from game.room import RoomType
+from game.stockpile import store_gold
+from game.tags import InStorage, IsActor, IsItem
+
+COARSE_STEP: Final = 1000
+"""Ticks advanced by each coarse step."""
+
+ACTION_TICKS: Final = 100
+"""Ticks of a typical action."""
+
+ENGAGEMENT_RATE: Final = 0.05
+"""Fraction of the strength of each side which lands as damage on the other side per action."""
+
+HAUL_TRIP_TICKS: Final = 3000
+"""Average ticks a minion takes to carry one loose gold pile to a treasury tile."""
+
+
+@attrs.define
+class FactionForce:
+    """Aggregate actors of one faction at a site."""
+
+    members: int
+    """Number of living actors."""
+    hp: float
+    """Total hit points of the living actors."""
+    hp_per_member: float
+    """Average hit points of an unhurt actor, used to derive casualties from lost hit points."""
+    strength_per_member: float
+    """Average strength of an actor."""
+    engaged: int
+    """Number of living actors in contact with an enemy, only these fight."""
+
+    @property
+    def strength(self) -> float:
+        """Total strength of the engaged actors."""
+        return self.engaged * self.strength_per_member
+
+    def take_damage(self, damage: float) -> None:
+        """Remove hit points and the actors who would have died from that damage.
+
+        The damage is limited to what the engaged actors can take, since they are the only ones who can be hit.
+        Casualties are taken from the engaged actors.
+        """
+        damage = min(damage, self.engaged * self.hp_per_member)
+        self.hp = max(0.0, self.hp - damage)
+        members = min(self.members, math.ceil(self.hp / self.hp_per_member))
+        self.engaged = max(0, self.engaged - (self.members - members))
+        self.members = members
+
+
+@attrs.define
+class SiteSummary:
+    """Aggregate state of an evicted site."""
+
+    tick: int
+    """Tick this summary has been simulated up to."""
+    forces: dict[Faction, FactionForce]
+    """Actors of each faction at the site."""
+    loose_piles: int
+    """Number of gold piles not yet in a treasury."""
+    loose_gold: int
+    """Total gold of the loose piles."""
+    free_treasury: int
+    """Number of treasury tiles without stored gold."""
+    hauled_piles: int = 0
+    """Number of loose piles moved into a treasury since the site was evicted."""
+    haul_progress: float = 0.0
+    """Partially completed hauling trips."""
+
+    def step(self, ticks: int) -> None:
+        """Advance this summary by `ticks`."""
+        actions = ticks / ACTION_TICKS
+        forces = [force for force in self.forces.values() if force.engaged]
+        if len(forces) > 1:
+            total_strength = sum(force.strength for force in forces)
+            for force in forces:  # Damage from all other factions, dealt simultaneously
+                force.take_damage((total_strength - force.strength) * ENGAGEMENT_RATE * actions)
+
+        minions = self.forces.get(Faction.Player)
+        if minions is None or not minions.members or not self.loose_piles or not self.free_treasury:
+            self.haul_progress = 0.0
+            return
+        self.haul_progress += minions.members * ticks / HAUL_TRIP_TICKS
+        trips = min(int(self.haul_progress), self.loose_piles, self.free_treasury)
+        self.haul_progress -= int(self.haul_progress)
+        self.loose_gold -= self.loose_gold * trips // self.loose_piles
+        self.loose_piles -= trips
+        self.free_treasury -= trips
+        self.hauled_piles += trips
+
+    def advance(self, tick: int) -> None:
+        """Advance this summary in whole coarse steps up to `tick`."""
+        while self.tick + COARSE_STEP <= tick:
+            self.step(COARSE_STEP)
+            self.tick += COARSE_STEP
+
+
+def _get_faction(actor: tcod.ecs.Entity) -> Faction | None:
+    """Return the faction of an actor."""
+    return next((faction for faction in Faction if faction in actor.tags), None)
+
+
+def _by_position(members: Iterable[tcod.ecs.Entity]) -> list[tcod.ecs.Entity]:
+    """Return located members sorted by position, so that random picks do not depend on set order."""
+    return sorted(
+        (entity for entity in members if Location in entity.components), key=lambda e: e.components[Location].ij
+    )
+
+
+def _get_fighters(members: Iterable[tcod.ecs.Entity]) -> dict[Faction, list[tcod.ecs.Entity]]:
+    """Return the living actors of each faction."""
+    fighters: dict[Faction, list[tcod.ecs.Entity]] = {}
+    for entity in _by_position(members):
+        faction = _get_faction(entity)
+        if IsActor in entity.tags and HP in entity.components and faction is not None:
+            fighters.setdefault(faction, []).append(entity)
+    return fighters
+
+
+def _get_engaged(fighters: dict[Faction, list[tcod.ecs.Entity]]) -> set[tcod.ecs.Entity]:
+    """Return the fighters which are within the sight radius of an enemy or have an enemy within their own."""
+    actors = [actor for faction_actors in fighters.values() for actor in faction_actors]
+    if not actors:
+        return set()
+    ij = np.array([actor.components[Location].ij for actor in actors])
+    radius = np.array([actor.components.get(SightRadius, 0) or np.iinfo(np.int32).max for actor in actors])
+    distance = np.abs(ij[:, np.newaxis, :] - ij[np.newaxis, :, :]).max(axis=2)  # Chebyshev distance of each pair
+    in_range = distance <= np.maximum(radius[:, np.newaxis], radius[np.newaxis, :])
+    return {
+        actor
+        for actor, row in zip(actors, in_range, strict=True)
+        if any(is_enemy(actor, actors[other]) for other in np.flatnonzero(row).tolist())
+    }
+
+
+def _get_loose_gold(members: Iterable[tcod.ecs.Entity]) -> list[tcod.ecs.Entity]:
+    """Return the gold piles which are not in a treasury."""
+    return [
+        entity
+        for entity in _by_position(members)
+        if IsItem in entity.tags and Gold in entity.components and InStorage not in entity.tags
+    ]
+
+
+def _get_free_treasury(site: tcod.ecs.Entity, members: Iterable[tcod.ecs.Entity]) -> list[Location]:
+    """Return the treasury tiles of a site without stored gold."""
+    free = site.components[RoomTypeLayer] == RoomType.Treasury
+    for entity in members:
+        if InStorage in entity.tags and Location in entity.components:
+            free[entity.components[Location].ij] = False
+    return [Location(int(x), int(y), site) for y, x in np.argwhere(free).tolist()]
+
+
+def summarize_site(site: tcod.ecs.Entity, members: set[tcod.ecs.Entity], tick: int) -> SiteSummary:
+    """Return the summary of a loaded site and its members."""
+    fighters = _get_fighters(members)
+    engaged = _get_engaged(fighters)
+    forces = {
+        faction: FactionForce(
+            members=len(actors),
+            hp=sum(actor.components[HP] for actor in actors),
+            hp_per_member=sum(max(actor.components[HP], 1) for actor in actors) / len(actors),
+            strength_per_member=sum(actor.components.get(Str, 0) for actor in actors) / len(actors),
+            engaged=sum(actor in engaged for actor in actors),
+        )
+        for faction, actors in fighters.items()
+    }
+    loose = _get_loose_gold(members)
+    return SiteSummary(
+        tick=tick,
+        forces=forces,
+        loose_piles=len(loose),
+        loose_gold=sum(pile.components[Gold] for pile in loose),
+        free_treasury=len(_get_free_treasury(site, members)),
+    )
+
+
+def apply_summary(site: tcod.ecs.Entity, members: set[tcod.ecs.Entity], summary: SiteSummary) -> None:
+    """Apply the outcome of a summary to the members of a site which was just loaded.
+
+    Casualties are picked at random from the actors in contact with an enemy first, hauled piles are picked at random.
+    The damage taken is spread over the surviving actors who were in contact.
+    """
+    rng = site.registry[None].components[Random]
+    fighters = _get_fighters(members)
+    engaged = _get_engaged(fighters)
+    for faction, actors in fighters.items():
+        force = summary.forces.get(faction)
+        if force is None:
+            continue
+        front = [actor for actor in actors if actor in engaged]
+        rear = [actor for actor in actors if actor not in engaged]
+        casualties = max(0, len(actors) - force.members)
+        victims = set(rng.sample(front, min(casualties, len(front))))
+        victims |= set(rng.sample(rear, casualties - len(victims)))
+        for victim in victims:
+            kill(victim)
+        survivors = [actor for actor in actors if actor not in victims]
+        wounded = [actor for actor in front if actor not in victims] or survivors  # The rear was not hit
+        lost_hp = sum(actor.components[HP] for actor in survivors) - force.hp
+        wounded_hp = sum(actor.components[HP] for actor in wounded)
+        if lost_hp > 0 and wounded_hp:
+            for actor in wounded:
+                actor.components[HP] = max(1, round(actor.components[HP] * max(0, 1 - lost_hp / wounded_hp)))
+
+    loose = _get_loose_gold(members)
+    treasury = _get_free_treasury(site, members)
+    hauled = min(summary.hauled_piles, len(loose), len(treasury))
+    for pile, pos in zip(rng.sample(loose, hauled), treasury, strict=False):
+        pile.components[Location] = pos
+        store_gold(pile)
+    if hauled:
+        site.components[GoldVersion] = site.components.get(GoldVersion, 0) + 1
@@ -1,11 +1,39 @@
-"""Site functions."""
+"""Site functions.
+
+Sites are the maps of the world.
+Sites the player has not been at for a while are evicted to their own file and removed from the registry, only the
+site entity itself remains with its name so that it is still listed by :any:`get_sites`.
+Evicted sites keep progressing through the coarse simulation of :any:`game.site_sim` and are loaded again on demand,
+their actors then resume their turns at full fidelity.
+Every eviction writes a new site file so that older saves still find the files they reference, files no save
+references are deleted when the world is saved in full.
+"""
 
 from __future__ import annotations
 
+import functools
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Final
+
 import tcod.ecs
 
-from game.components import Name
-from game.tags import IsSite
+from game.components import EvictedAt, LastActiveTick, Location, Name, PendingSiteWrite, SiteFile, mark_changed
+from game.saving import DERIVED_COMPONENTS, SITE_DIR, load_site_state, snapshot_site, write_snapshot
+from game.site_sim import SiteSummary, apply_summary, summarize_site
+from game.tags import FacetOf, IsPlayer, IsSite
+from game.timesys import Tick, Ticket, TurnQueue
+
+type SiteWriter = Callable[[Callable[[], None]], Future[None]]
+"""Runs a write in the background in order with other saves, such as :any:`Autosaver.submit`."""
+
+SITE_IDLE_TICKS: Final = 10_000
+"""Ticks since the player was last at a site before it is evicted."""
+
+_SITE_KEPT_COMPONENTS: Final = frozenset({Name, SiteFile, LastActiveTick})
+"""Components which stay on the site entity while the site is evicted."""
 
 
 def new_site(registry: tcod.ecs.Registry, name: str) -> tcod.ecs.Entity:
@@ -13,9 +41,157 @@ def new_site(registry: tcod.ecs.Registry, name: str) -> tcod.ecs.Entity:
     site = registry[object()]
     site.tags.add(IsSite)
     site.components[Name] = name
+    mark_changed(site)
     return site
 
 
 def get_sites(registry: tcod.ecs.Registry) -> list[tcod.ecs.Entity]:
     """Return the list of known sites in order."""
     return sorted(registry.Q.all_of(tags=[IsSite]), key=lambda e: e.components[Name])
+
+
+def get_active_site(registry: tcod.ecs.Registry) -> tcod.ecs.Entity | None:
+    """Return the site the player is at."""
+    for player in registry.Q.all_of(components=[Location], tags=[IsPlayer]):
+        return player.components[Location].map
+    return None
+
+
+def is_site_loaded(site: tcod.ecs.Entity) -> bool:
+    """Return True if a site is in the registry, False if it is evicted."""
+    return EvictedAt not in site.components
+
+
+def get_site_members(site: tcod.ecs.Entity) -> set[tcod.ecs.Entity]:
+    """Return the entities located at a site along with the facets of those entities."""
+    registry = site.registry
+    members = {entity for entity in registry.Q.all_of(components=[Location]) if entity.components[Location].map is site}
+    members.update(
+        facet for facet in registry.Q.all_of(relations=[(FacetOf, ...)]) if facet.relation_tag[FacetOf] in members
+    )
+    return members
+
+
+def evict_site(site: tcod.ecs.Entity, site_dir: Path = SITE_DIR, writer: SiteWriter | None = None) -> None:
+    """Save a site to its own file and remove its map and entities from the registry.
+
+    The file is written by `writer` if given, otherwise it is written before this returns.
+    """
+    if not is_site_loaded(site):
+        return
+    registry = site.registry
+    assert site is not get_active_site(registry), "The site of the player can not be evicted."
+    members = get_site_members(site)
+    for key in list(site.components.keys()):
+        if key in DERIVED_COMPONENTS:
+            del site.components[key]  # Also skips updating derived layers as members are removed
+    snapshot = snapshot_site(site, members)
+    path = site_dir / f"{uuid.uuid4().hex}.sav"  # A new file each time, saves of earlier versions may still use the old
+    now = registry[None].components.get(Tick, 0)
+    summary = summarize_site(site, members, now)
+
+    queue = registry[None].components.get(TurnQueue)
+    for entity in members:
+        ticket = entity.components.get(Ticket)
+        if ticket is not None and queue is not None:
+            queue.remove(ticket)  # Removed first so that the ticket is not counted as cancelled
+        entity.clear()
+    for key in list(site.components.keys()):
+        if key not in _SITE_KEPT_COMPONENTS:
+            del site.components[key]
+    site.tags.clear()
+    site.tags.add(IsSite)
+    site.components[SiteFile] = str(path)
+    site.components[EvictedAt] = now
+    site.components[SiteSummary] = summary
+    mark_changed(site, *members)
+    if writer is None:
+        write_snapshot(snapshot, path)
+    else:
+        site.components[PendingSiteWrite] = writer(functools.partial(write_snapshot, snapshot, path))
+
+
+def _restore_relations(state: dict[str, Any]) -> None:
+    """Add the relations and names of a saved site state to the registry."""
+    for origin, by_tag in state["_relation_tags_by_entity"].items():
+        for tag, targets in by_tag.items():
+            origin.relation_tags_many[tag] |= targets
+    for origin, by_key in state["_relation_components_by_entity"].items():
+        for key, by_target in by_key.items():
+            for target, value in by_target.items():
+                origin.relation_components[key][target] = value
+    for name, entity in state["_names_by_name"].items():
+        entity.name = name
+
+
+def load_site(site: tcod.ecs.Entity) -> None:
+    """Load an evicted site back into the registry.
+
+    The outcome of the coarse simulation is applied and its actors are rescheduled for the time they missed.
+    """
+    if is_site_loaded(site):
+        return
+    registry = site.registry
+    pending = site.components.pop(PendingSiteWrite, None)
+    if pending is not None:
+        pending.result()  # The file must be written before it can be read
+    state = load_site_state(site, Path(site.components.pop(SiteFile)))
+    now = registry[None].components.get(Tick, 0)
+    elapsed = now - site.components.pop(EvictedAt)
+    summary = site.components.pop(SiteSummary, None)
+
+    components_by_type: dict[Any, dict[tcod.ecs.Entity, Any]] = state["_components_by_type"]
+    tickets: dict[tcod.ecs.Entity, Ticket] = components_by_type.pop(Ticket, {})
+    for key, by_entity in components_by_type.items():
+        if site in by_entity:  # Members are placed on the map of the site
+            site.components[key] = by_entity.pop(site)
+    for entity, tags in state["_tags_by_entity"].items():
+        entity.tags |= tags
+    _restore_relations(state)
+    for key, by_entity in components_by_type.items():
+        for entity, value in by_entity.items():
+            entity.components[key] = value
+
+    queue = registry[None].components.setdefault(TurnQueue, TurnQueue())
+    for entity, ticket in tickets.items():
+        entity.components[Ticket] = resumed = ticket._replace(
+            time=ticket.time + elapsed, start_time=ticket.start_time + elapsed
+        )
+        queue.push(resumed)
+
+    members = get_site_members(site)
+    if summary is not None:
+        summary.advance(now)
+        apply_summary(site, members, summary)
+    mark_changed(site, *members)
+
+
+def evict_idle_sites(
+    registry: tcod.ecs.Registry,
+    idle_ticks: int = SITE_IDLE_TICKS,
+    site_dir: Path = SITE_DIR,
+    writer: SiteWriter | None = None,
+) -> list[tcod.ecs.Entity]:
+    """Evict the sites which the player has not been at for `idle_ticks`, return the evicted sites.
+
+    Site files are written by `writer` if given, see :any:`evict_site`.
+    Already evicted sites are advanced by the coarse simulation.
+    """
+    now = registry[None].components.get(Tick, 0)
+    active = get_active_site(registry)
+    evicted = []
+    for site in list(registry.Q.all_of(tags=[IsSite])):
+        if site is active:
+            site.components[LastActiveTick] = now
+            mark_changed(site)
+        elif (summary := site.components.get(SiteSummary)) is not None:
+            summary.advance(now)
+            mark_changed(site)
+        elif is_site_loaded(site):
+            if LastActiveTick not in site.components:
+                site.components[LastActiveTick] = now
+                mark_changed(site)
+            if now - site.components[LastActiveTick] >= idle_ticks:
+                evict_site(site, site_dir, writer)
+                evicted.append(site)
+    return evicted
@@ -0,0 +1,164 @@
+"""Spatial index of entity locations."""
+
+from __future__ import annotations
+
+from enum import IntEnum
+
+import numpy as np
+import tcod.ecs
+import tcod.ecs.callbacks
+from numpy.typing import NDArray
+
+from game.components import Location
+from game.tags import FacetOf, IsActor, IsItem
+
+
+class EntityKind(IntEnum):
+    """Kinds of indexed entities, higher kinds are drawn on top of lower kinds."""
+
+    Other = 0
+    Item = 1
+    Actor = 2
+    Facet = 3
+
+
+def get_entity_kind(entity: tcod.ecs.Entity) -> EntityKind:
+    """Return the kind of an entity from its tags and relations."""
+    if FacetOf in entity.relation_tag:
+        return EntityKind.Facet
+    if IsActor in entity.tags:
+        return EntityKind.Actor
+    if IsItem in entity.tags:
+        return EntityKind.Item
+    return EntityKind.Other
+
+
+class SpatialIndex:
+    """Per-map index of located entities.
+
+    Each entity is given a slot.
+    `heads` has the first slot of each occupied tile and `next_slot` chains the other slots on the same tile, whatever
+    their kind, so that memory use scales with the number of entities instead of the map area.
+    Slot positions and kinds are also stored as arrays so that region queries can be vectorized.
+    """
+
+    __slots__ = ("entities", "free_slots", "heads", "next_slot", "slot_ij", "slot_kind", "slots")
+
+    def __init__(self, capacity: int = 64) -> None:
+        """Initialize an empty index."""
+        self.heads: dict[tuple[int, int], int] = {}
+        self.next_slot: NDArray[np.int32] = np.full(capacity, -1, dtype=np.int32)
+        self.slot_ij: NDArray[np.int32] = np.zeros((capacity, 2), dtype=np.int32)
+        self.slot_kind: NDArray[np.int8] = np.full(capacity, -1, dtype=np.int8)
+        self.entities: list[tcod.ecs.Entity | None] = [None] * capacity
+        self.slots: dict[tcod.ecs.Entity, int] = {}
+        self.free_slots: list[int] = list(range(capacity - 1, -1, -1))
+
+    def _grow(self) -> None:
+        """Double the slot capacity."""
+        capacity = len(self.entities)
+        self.next_slot = np.concatenate([self.next_slot, np.full(capacity, -1, dtype=np.int32)])
+        self.slot_ij = np.concatenate([self.slot_ij, np.zeros((capacity, 2), dtype=np.int32)])
+        self.slot_kind = np.concatenate([self.slot_kind, np.full(capacity, -1, dtype=np.int8)])
+        self.entities += [None] * capacity
+        self.free_slots += range(capacity * 2 - 1, capacity - 1, -1)
+
+    def add(self, entity: tcod.ecs.Entity, ij: tuple[int, int]) -> None:
+        """Add an entity at `ij`."""
+        assert entity not in self.slots
+        if not self.free_slots:
+            self._grow()
+        slot = self.free_slots.pop()
+        kind = get_entity_kind(entity)
+        self.slots[entity] = slot
+        self.entities[slot] = entity
+        self.slot_ij[slot] = ij
+        self.slot_kind[slot] = kind
+        self.next_slot[slot] = self.heads.get(ij, -1)
+        self.heads[ij] = slot
+
+    def remove(self, entity: tcod.ecs.Entity) -> None:
+        """Remove an entity from this index if it exists."""
+        slot = self.slots.pop(entity, None)
+        if slot is None:
+            return
+        i, j = self.slot_ij[slot].tolist()
+        next_slot = int(self.next_slot[slot])
+        if self.heads[i, j] == slot:
+            if next_slot == -1:
+                del self.heads[i, j]
+            else:
+                self.heads[i, j] = next_slot
+        else:
+            prev = self.heads[i, j]
+            while self.next_slot[prev] != slot:
+                prev = int(self.next_slot[prev])
+            self.next_slot[prev] = next_slot
+        self.next_slot[slot] = -1
+        self.slot_kind[slot] = -1
+        self.entities[slot] = None
+        self.free_slots.append(slot)
+
+    def at(self, ij: tuple[int, int], kind: EntityKind) -> list[tcod.ecs.Entity]:
+        """Return the entities of `kind` at `ij`."""
+        result = []
+        slot = self.heads.get(ij, -1)
+        while slot != -1:
+            if self.slot_kind[slot] == kind:
+                entity = self.entities[slot]
+                assert entity is not None
+                result.append(entity)
+            slot = int(self.next_slot[slot])
+        return result
+
+    def region_slots(self, region: tuple[slice, slice]) -> NDArray[np.intp]:
+        """Return the occupied slots within a region of the map."""
+        i_slice, j_slice = region
+        i = self.slot_ij[:, 0]
+        j = self.slot_ij[:, 1]
+        return np.flatnonzero(
+            (self.slot_kind != -1)
+            & (i_slice.start <= i)
+            & (i < i_slice.stop)
+            & (j_slice.start <= j)
+            & (j < j_slice.stop)
+        )
+
+    def in_region(self, region: tuple[slice, slice]) -> list[tcod.ecs.Entity]:
+        """Return all entities within a region of the map."""
+        return [entity for slot in self.region_slots(region).tolist() if (entity := self.entities[slot]) is not None]
+
+
+def get_spatial_index(map_: tcod.ecs.Entity) -> SpatialIndex:
+    """Return the spatial index of a map, building it if it does not exist."""
+    index = map_.components.get(SpatialIndex)
+    if index is None:
+        map_.components[SpatialIndex] = index = SpatialIndex()
+        for entity in map_.registry.Q.all_of(components=[Location]):
+            pos = entity.components[Location]
+            if pos.map is map_:
+                index.add(entity, pos.ij)
+    return index
+
+
+def reindex(entity: tcod.ecs.Entity) -> None:
+    """Update an entity after its kind has changed."""
+    pos = entity.components.get(Location)
+    if pos is None:
+        return
+    index = pos.map.components.get(SpatialIndex)
+    if index is None:
+        return
+    index.remove(entity)
+    index.add(entity, pos.ij)
+
+
+@tcod.ecs.callbacks.register_component_changed(component=Location)
+def on_location_changed(entity: tcod.ecs.Entity, old: Location | None, new: Location | None) -> None:
+    """Keep map spatial indexes up to date."""
+    if old == new:
+        return
+    if old is not None and (index := old.map.components.get(SpatialIndex)) is not None:
+        index.remove(entity)
+    if new is not None and (index := new.map.components.get(SpatialIndex)) is not None:
+        index.add(entity, new.ij)
@@ -19,8 +19,11 @@ def on_render(self, console: tcod.console.Console, /) -> None:
         """State rendering routine."""
         ...
 
-    def on_update(self) -> bool:
-        """Every frame/update."""
+    def on_update(self) -> bool | State:
+        """Every frame/update.
+
+        Returns True if the state changed and should be redrawn, or a new state to switch to.
+        """
         ...
 
 
@@ -2,6 +2,10 @@
 
 from __future__ import annotations
 
+import logging
+import time
+from collections import deque
+
 import attrs
 import tcod.console
 import tcod.constants
@@ -11,21 +15,26 @@
 from tcod.event import KeySym
 
 import g
-from game.action_logic import do_action
+from game.action import Action  # noqa: TC001
+from game.action_logic import do_action, is_player_turn, simulate
 from game.actions import Bump, MinionAI, StampRoom, idle
 from game.actor_logic import spawn_actor
 from game.components import Gold, Location
-from game.constants import DIR_KEYS, WAIT_KEYS
+from game.constants import DIR_KEYS, GOD_MODE_SPEEDS, MAX_QUEUED_ACTIONS, WAIT_KEYS
 from game.faction import Faction
 from game.menus import main_menu
+from game.pregen import PendingWorld  # noqa: TC001
 from game.rendering import render_world
 from game.room import RoomType
 from game.state import State, StateResult  # noqa: TC001
-from game.tags import InStorage, IsPlayer
+from game.stockpile import get_stored_gold
+from game.tags import IsPlayer
 from game.timesys import Tick
 from game.widget import Widget, WidgetRenderInfo, WidgetSizeInfo
 from game.widgets import Button, ListMenu
 
+logger = logging.getLogger(__name__)
+
 
 @attrs.define()
 class ModalState:
@@ -43,19 +52,24 @@ def _cast() -> StateResult:
 
 
 @attrs.define()
-class InGame(ModalState):
-    """Player in control state."""
+class InGame:
+    """Player in control state.
+
+    The world is simulated within the frame budget, player actions are queued until it is the player's turn.
+    """
+
+    pending: deque[Action] = attrs.field(factory=deque)
+    """Player actions waiting for the player's turn."""
 
     def on_event(self, event: tcod.event.Event) -> StateResult:  # noqa: PLR0911
         """State event handler."""
-        (player,) = g.registry.Q.all_of(tags=[IsPlayer])
         match event:
             case tcod.event.KeyDown(sym=sym) if sym in DIR_KEYS:
-                return do_action(player, Bump(DIR_KEYS[sym], allow_dig=True))
+                return self.queue_action(Bump(DIR_KEYS[sym], allow_dig=True))
             case tcod.event.KeyDown(sym=sym) if sym in WAIT_KEYS:
-                return do_action(player, idle)
+                return self.queue_action(idle)
             case tcod.event.KeyDown(sym=KeySym.T):
-                return do_action(player, StampRoom(RoomType.Treasury))
+                return self.queue_action(StampRoom(RoomType.Treasury))
             case tcod.event.KeyDown(sym=KeySym.ESCAPE):
                 return UIState(self, main_menu(self))
             case tcod.event.KeyDown(sym=KeySym.SPACE):
@@ -65,6 +79,30 @@ def on_event(self, event: tcod.event.Event) -> StateResult:  # noqa: PLR0911
 
         return self
 
+    def queue_action(self, action: Action) -> StateResult:
+        """Perform a player action now if possible, otherwise queue it for the player's next turn."""
+        if len(self.pending) < MAX_QUEUED_ACTIONS:
+            self.pending.append(action)
+        self.perform_pending()
+        return self
+
+    def perform_pending(self) -> bool:
+        """Perform queued player actions while it is the player's turn, return True if any were performed."""
+        performed = False
+        while self.pending and is_player_turn(g.registry):
+            (player,) = g.registry.Q.all_of(tags=[IsPlayer])
+            do_action(player, self.pending.popleft(), blocking=False)
+            performed = True
+        return performed
+
+    def on_update(self) -> bool:
+        """Resume the simulation within the frame budget and perform any queued actions."""
+        if is_player_turn(g.registry):
+            return self.perform_pending()
+        simulate(g.registry, g.simulation_budget)
+        self.perform_pending()
+        return True
+
     def on_render(self, console: tcod.console.Console) -> None:
         """State rendering routine."""
         render_world(g.registry, console)
@@ -75,7 +113,7 @@ def on_render(self, console: tcod.console.Console) -> None:
         console.print(
             0,
             2,
-            f"Gold store: {sum(e.components[Gold] for e in g.registry.Q.all_of(components=[Gold], tags=[InStorage]))} ",
+            f"Gold store: {get_stored_gold(g.registry)} ",
             fg=(255, 255, 255),
             bg=(0, 0, 0),
         )
@@ -83,9 +121,16 @@ def on_render(self, console: tcod.console.Console) -> None:
 
 @attrs.define()
 class GodMode:
-    """Omniscient top-down view."""
+    """Omniscient top-down view.
+
+    Time advances by `speed` player turns per frame, limited by the frame budget.
+    """
 
     paused: bool = False
+    speed: int | None = 1
+    """Player turns per frame, or None to run as many as fit in the frame budget."""
+    samples: deque[tuple[float, int]] = attrs.field(factory=lambda: deque(maxlen=30), init=False)
+    """Recent times and ticks used to measure the simulation rate."""
 
     def on_event(self, event: tcod.event.Event) -> StateResult:
         """State event handler."""
@@ -94,19 +139,78 @@ def on_event(self, event: tcod.event.Event) -> StateResult:
                 return UIState(self, main_menu(self))
             case tcod.event.KeyDown(sym=KeySym.SPACE):
                 return InGame()
+            case tcod.event.KeyDown(sym=sym) if sym in GOD_MODE_SPEEDS:
+                self.speed = GOD_MODE_SPEEDS[sym]
         return self
 
     def on_update(self) -> bool:
-        """Auto advance time."""
-        if not self.paused:
-            (player,) = g.registry.Q.all_of(tags=[IsPlayer])
-            do_action(player, idle)
-            return True
-        return False
+        """Auto advance time within the frame budget."""
+        if self.paused:
+            return False
+        deadline = time.perf_counter() + g.simulation_budget
+        turns = 0
+        while True:
+            if is_player_turn(g.registry):
+                if self.speed is not None and turns >= self.speed:
+                    break
+                (player,) = g.registry.Q.all_of(tags=[IsPlayer])
+                do_action(player, idle, blocking=False)
+                turns += 1
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not simulate(g.registry, remaining) or not is_player_turn(g.registry):
+                break
+        self.samples.append((time.perf_counter(), g.registry[None].components.get(Tick, 0)))
+        return True
+
+    @property
+    def tick_rate(self) -> float:
+        """Measured ticks per second over recent frames."""
+        if len(self.samples) < 2:  # noqa: PLR2004
+            return 0.0
+        (start_time, start_tick), (end_time, end_tick) = self.samples[0], self.samples[-1]
+        return (end_tick - start_tick) / (end_time - start_time) if end_time > start_time else 0.0
 
     def on_render(self, console: tcod.console.Console) -> None:
-        """Same rendering as InGame."""
+        """Same rendering as InGame with the speed and simulation rate."""
         InGame().on_render(console)
+        speed = "max" if self.speed is None else f"{self.speed}x"
+        console.print(
+            0, console.height - 1, f"Speed: {speed} {self.tick_rate:.0f} ticks/s ", fg=(255, 255, 255), bg=(0, 0, 0)
+        )
+
+
+@attrs.define()
+class GeneratingWorld:
+    """Show the progress of a world generating in the background, then play it."""
+
+    pending: PendingWorld
+
+    def on_event(self, _event: tcod.event.Event) -> StateResult:
+        """Ignore events while generating."""
+        return self
+
+    def on_update(self) -> bool | State:
+        """Start the new game once the world is ready, return to the main menu if generation failed."""
+        g.pregen.poll()
+        if not self.pending.done():
+            return True
+        try:
+            g.registry = self.pending.build()
+        except Exception:
+            logger.exception("World generation failed.")
+            return UIState(None, main_menu(None))
+        return InGame()
+
+    def on_render(self, console: tcod.console.Console) -> None:
+        """Render a progress bar."""
+        width = min(30, console.width)
+        x = console.width // 2 - width // 2
+        y = console.height // 2
+        console.print(x, y - 1, "Generating world...", fg=(255, 255, 255))
+        console.draw_rect(x, y, width, 1, ch=0x20, bg=(0x40, 0x40, 0x40))
+        filled = round(width * self.pending.progress)
+        if filled:
+            console.draw_rect(x, y, filled, 1, ch=0x20, bg=(0x80, 0x80, 0x80))
 
 
 @attrs.define()
@@ -0,0 +1,86 @@
+"""Index of storage slots and the gold stored in them."""
+
+from __future__ import annotations
+
+import numpy as np
+import tcod.ecs
+from numpy.typing import NDArray
+
+from game.components import Gold, Location, RoomTypeLayer, Shape, mark_changed
+from game.room import RoomType
+from game.tags import InStorage, IsSite
+
+
+class Stockpile:
+    """Per-map index of storage slots.
+
+    Every treasury tile is a slot which holds at most one pile of stored gold.
+    `free` masks the free slots so that it can be used as flow field roots, `free_count` is the number of them.
+    `piles` has the stored piles by position, piles left outside of a treasury still count towards `total_gold`.
+    This is derived from the room layer and the stored gold, it is never saved and is rebuilt on demand.
+    """
+
+    __slots__ = ("free", "free_count", "piles", "total_gold")
+
+    def __init__(self, shape: tuple[int, int]) -> None:
+        """Initialize an empty index for a map of `shape`."""
+        self.free: NDArray[np.bool_] = np.zeros(shape, dtype=np.bool_)
+        self.free_count = 0
+        self.piles: dict[tuple[int, int], tcod.ecs.Entity] = {}
+        self.total_gold = 0
+
+    def _set_free(self, ij: tuple[int, int], *, free: bool) -> None:
+        """Mark a tile as a free slot or not."""
+        self.free_count += int(free) - int(self.free[ij])
+        self.free[ij] = free
+
+    def set_slot(self, ij: tuple[int, int], *, is_slot: bool) -> None:
+        """Add or remove a storage slot after the room of a tile changed."""
+        self._set_free(ij, free=is_slot and ij not in self.piles)
+
+    def store(self, ij: tuple[int, int], pile: tcod.ecs.Entity) -> None:
+        """Add a stored gold pile at `ij`."""
+        self.piles[ij] = pile
+        self.total_gold += pile.components[Gold]
+        self._set_free(ij, free=False)
+
+
+def get_stockpile(map_: tcod.ecs.Entity) -> Stockpile:
+    """Return the stockpile index of a map, building it if it does not exist."""
+    stockpile = map_.components.get(Stockpile)
+    if stockpile is None:
+        map_.components[Stockpile] = stockpile = Stockpile(map_.components[Shape])
+        slots = map_.components[RoomTypeLayer] == RoomType.Treasury
+        for i, j in np.argwhere(slots).tolist():
+            stockpile.set_slot((i, j), is_slot=True)
+        for pile in map_.registry.Q.all_of(components=[Gold, Location], tags=[InStorage]):
+            pos = pile.components[Location]
+            if pos.map is map_:
+                stockpile.store(pos.ij, pile)
+    return stockpile
+
+
+def update_stockpile_slot(pos: Location) -> None:
+    """Update the stockpile after the room at `pos` was changed."""
+    stockpile = pos.map.components.get(Stockpile)
+    if stockpile is None:
+        return  # Built on demand later.
+    stockpile.set_slot(pos.ij, is_slot=pos.map.components[RoomTypeLayer][pos.ij] == RoomType.Treasury)
+
+
+def store_gold(pile: tcod.ecs.Entity) -> None:
+    """Mark a gold pile as stored at its location and update the stockpile of its map."""
+    pile.tags.add(InStorage)
+    mark_changed(pile)
+    pos = pile.components[Location]
+    stockpile = pos.map.components.get(Stockpile)
+    if stockpile is not None:
+        stockpile.store(pos.ij, pile)
+
+
+def get_stored_gold(registry: tcod.ecs.Registry) -> int:
+    """Return the total stored gold of the loaded sites."""
+    return sum(
+        get_stockpile(site).total_gold
+        for site in registry.Q.all_of(components=[RoomTypeLayer], tags=[IsSite])  # Evicted sites have no layers
+    )
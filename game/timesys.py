@@ -2,11 +2,15 @@
 
 from __future__ import annotations
 
-import heapq
 import logging
+from collections.abc import Iterable, Iterator
 from typing import Final, NamedTuple
 
+import attrs
 import tcod.ecs
+import tcod.ecs.callbacks
+
+from game.components import mark_changed
 
 logger = logging.getLogger(__name__)
 
@@ -22,36 +26,171 @@ class Ticket(NamedTuple):
 
 Tick: Final = ("Tick", int)
 NextTicketUID: Final = ("NextTicketUID", int)
-TurnQueue: Final = ("TurnQueue", list[Ticket])
+
+
+def is_stale(ticket: Ticket) -> bool:
+    """Return True if the entity of a ticket no longer holds that ticket."""
+    return ticket is not ticket.entity.components.get(Ticket)
+
+
+class TurnQueue:
+    """Indexed priority queue of tickets, ordered by time and then by UID.
+
+    Tickets can be removed from anywhere in the queue in O(log n).
+    Replaced and removed tickets are taken out as soon as that happens, so stale tickets do not build up and the
+    queue never needs compacting.
+    """
+
+    __slots__ = ("cancelled", "heap", "index")
+
+    def __init__(self, tickets: Iterable[Ticket] = ()) -> None:
+        """Initialize a queue from any existing tickets."""
+        self.heap: list[Ticket] = sorted(tickets)
+        self.index: dict[int, int] = {ticket.uid: i for i, ticket in enumerate(self.heap)}
+        """Heap position of each ticket by UID."""
+        self.cancelled = 0
+        """Total number of tickets removed before their turn."""
+
+    def __setstate__(self, state: tuple[None, dict[str, object]]) -> None:
+        """Restore a pickled queue, ignoring the compaction count of older saves."""
+        _, slots = state
+        for name in self.__slots__:
+            setattr(self, name, slots[name])
+
+    def __len__(self) -> int:
+        """Return the number of queued tickets."""
+        return len(self.heap)
+
+    def __iter__(self) -> Iterator[Ticket]:
+        """Iterate over tickets in heap order."""
+        return iter(self.heap)
+
+    def __contains__(self, ticket: object) -> bool:
+        """Return True if this exact ticket is queued."""
+        if not isinstance(ticket, Ticket):
+            return False
+        i = self.index.get(ticket.uid)
+        return i is not None and self.heap[i] is ticket
+
+    def peek(self) -> Ticket:
+        """Return the next ticket without removing it."""
+        return self.heap[0]
+
+    def push(self, ticket: Ticket) -> None:
+        """Add a ticket to the queue."""
+        assert ticket.uid not in self.index
+        self.heap.append(ticket)
+        self.index[ticket.uid] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def remove(self, ticket: Ticket) -> bool:
+        """Remove a ticket from anywhere in the queue, return False if it was not queued."""
+        if ticket not in self:
+            return False
+        i = self.index.pop(ticket.uid)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.index[last.uid] = i
+            self._sift_up(i)
+            self._sift_down(self.index[last.uid])
+        return True
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.index[heap[i].uid] = i
+        self.index[heap[j].uid] = j
+
+    def _sift_up(self, i: int) -> None:
+        heap = self.heap
+        while i > 0:
+            parent = (i - 1) // 2
+            if heap[parent][:2] <= heap[i][:2]:
+                return
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int) -> None:
+        heap = self.heap
+        size = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and heap[child][:2] < heap[smallest][:2]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+
+@attrs.define(frozen=True)
+class QueueStats:
+    """Turn queue statistics for monitoring."""
+
+    size: int
+    """Number of queued tickets."""
+    stale: int
+    """Number of queued tickets no longer held by their entity."""
+    cancelled: int
+    """Total number of tickets cancelled before their turn."""
+
+    @property
+    def stale_ratio(self) -> float:
+        """Fraction of the queue which is stale."""
+        return self.stale / self.size if self.size else 0.0
+
+
+def get_queue_stats(registry: tcod.ecs.Registry) -> QueueStats:
+    """Return the current statistics of the turn queue."""
+    queue = registry[None].components.setdefault(TurnQueue, TurnQueue())
+    return QueueStats(
+        size=len(queue),
+        stale=sum(is_stale(ticket) for ticket in queue),
+        cancelled=queue.cancelled,
+    )
+
+
+@tcod.ecs.callbacks.register_component_changed(component=Ticket)
+def on_ticket_changed(entity: tcod.ecs.Entity, old: Ticket | None, new: Ticket | None) -> None:
+    """Remove replaced or removed tickets from the queue."""
+    mark_changed(entity)
+    if old is None or old is new:
+        return
+    queue = entity.registry[None].components.get(TurnQueue)
+    if queue is not None and queue.remove(old) and old.time > entity.registry[None].components.get(Tick, 0):
+        queue.cancelled += 1  # Removed before its turn came up.
 
 
 def schedule(entity: tcod.ecs.Entity, interval: int) -> Ticket:
-    """Schedule an entity to run after an interval."""
+    """Schedule an entity to run after an interval, replacing its previous ticket."""
     registry = entity.registry
-    entity.components[Ticket] = ticket = Ticket(
+    queue = registry[None].components.setdefault(TurnQueue, TurnQueue())
+    ticket = Ticket(
         time=registry[None].components.setdefault(Tick, 0) + interval,
         uid=registry[None].components.setdefault(NextTicketUID, 0),
         entity=entity,
         start_time=registry[None].components[Tick],
     )
-    queue = registry[None].components.setdefault(TurnQueue, [])
-    heapq.heappush(queue, ticket)
+    entity.components[Ticket] = ticket
+    queue.push(ticket)
     registry[None].components[NextTicketUID] += 1
     return ticket
 
 
 def unschedule(ticket: Ticket) -> None:
-    """Remove a scheduled ticket from the from of the queue."""
+    """Remove a ticket from the queue if it is still scheduled."""
     queue = ticket.entity.registry[None].components[TurnQueue]
-    assert ticket is queue[0]
-    heapq.heappop(queue)
-    logger.debug("unscheduled: %s", ticket)
+    if queue.remove(ticket):
+        logger.debug("unscheduled: %s", ticket)
 
 
 def next_ticket(registry: tcod.ecs.Registry) -> Ticket:
     """Return the next valid Ticket."""
     queue = registry[None].components[TurnQueue]
-    while queue[0] is not queue[0].entity.components.get(Ticket):
-        heapq.heappop(queue)
-    registry[None].components[Tick] = queue[0].time
-    return queue[0]
+    while is_stale(queue.peek()):  # Only possible if a ticket was changed without its callback
+        logger.warning("removed stale ticket: %s", queue.peek())
+        queue.remove(queue.peek())
+    registry[None].components[Tick] = queue.peek().time
+    return queue.peek()
@@ -6,7 +6,13 @@
 
 from tcod.ecs import Entity
 
-from game.components import Location, Offset, Shape, TilesLayer
+from game.components import Location, Offset, Shape, TerrainVersion, TilesLayer, mark_tile_changed
+from game.fov import update_tile_transparency
+from game.path_hierarchy import invalidate_path_hierarchy
+from game.pathfinding import update_tile_cost
+from game.rendering import update_tile_glyph
+from game.sites import load_site
+from game.spatial import EntityKind, get_spatial_index
 from game.tags import FacetOf, IsActor
 from game.tile import TileDB
 
@@ -43,6 +49,7 @@ def check_move(entity: Entity, dest: Location, *, allow_dig: bool) -> int | None
     assert isinstance(dest_tile, int)
     costs = []
     _is_multi_tile = is_multi_tile(entity)
+    index = get_spatial_index(dest.map)
     for facet_dest in iter_entity_locations(entity, dest):
         if not in_bounds(facet_dest):
             continue
@@ -53,15 +60,15 @@ def check_move(entity: Entity, dest: Location, *, allow_dig: bool) -> int | None
             return None  # Tile is solid
 
         if not _is_multi_tile:
-            for e in entity.registry.Q.all_of(tags=[facet_dest, IsActor]):
+            for e in index.at(facet_dest.ij, EntityKind.Actor):
                 if e is entity:
                     continue  # No self collision
                 if e.components[Location] == dest:
                     return None  # Space occupied by actor
         else:
-            for e in entity.registry.Q.all_of(
-                tags=[facet_dest], relations=[(FacetOf, entity.registry.Q.all_of(tags=[IsActor]))]
-            ):
+            for e in index.at(facet_dest.ij, EntityKind.Facet):
+                if IsActor not in e.relation_tag[FacetOf].tags:
+                    continue
                 if e.relation_tag[FacetOf] is entity:
                     continue  # No self collision
                 if e.components[Location] == dest:
@@ -79,10 +86,17 @@ def _touch_tile(dest: Location) -> None:
     dest_tile = dest.map.components[TilesLayer][dest.ij]
     if tile_db.data["dig_cost"][dest_tile]:
         dest.map.components[TilesLayer][dest.ij] = tile_db.names[str(tile_db.data["excavated_tile"][dest_tile])]
+        dest.map.components[TerrainVersion] = dest.map.components.get(TerrainVersion, 0) + 1
+        mark_tile_changed(dest)
+        update_tile_cost(dest)
+        invalidate_path_hierarchy(dest)
+        update_tile_transparency(dest)
+        update_tile_glyph(dest)
 
 
 def force_move(entity: Entity, dest: Location) -> None:
-    """Move an entity to a specific location."""
+    """Move an entity to a specific location, loading the site of that location if it was evicted."""
+    load_site(dest.map)
     _touch_tile(dest)
     entity.components[Location] = entity_pos = dest
     for facet in entity.registry.Q.all_of(relations=[(FacetOf, entity)]):
@@ -9,9 +9,9 @@
 
 from game.actions import MinionAI
 from game.actor_logic import spawn_actor
-from game.components import HP, Graphic, Location, MaxHP, Offset, Str, Vector2
+from game.components import HP, Graphic, Location, MaxHP, Offset, Shape, SightRadius, Str, Vector2
 from game.faction import Faction
-from game.map_gen import generate_cave_map
+from game.map_gen import CaveConfig, CavePlan, Rect, build_cave_map, plan_cave
 from game.tags import FacetOf, IsActor, IsItem, IsPlayer
 from game.tile import Tile, TileDB
 from game.timesys import schedule
@@ -41,16 +41,19 @@ def init_world(registry: tcod.ecs.Registry) -> None:
     kobold.components[Graphic] = Graphic(ord("k"))
     kobold.components[Str] = 2
     kobold.components[MaxHP] = 4
+    kobold.components[SightRadius] = 8
 
     orc = registry["orc"]
     orc.components[Graphic] = Graphic(ord("o"))
     orc.components[Str] = 3
     orc.components[MaxHP] = 8
+    orc.components[SightRadius] = 10
 
     human = registry["human"]
     human.components[Graphic] = Graphic(ord("U"))
     human.components[Str] = 3
     human.components[MaxHP] = 8
+    human.components[SightRadius] = 10
 
 
 def _configure_multi_tile_entity(entity: tcod.ecs.Entity, graphic: Iterable[str]) -> None:
@@ -65,12 +68,39 @@ def _configure_multi_tile_entity(entity: tcod.ecs.Entity, graphic: Iterable[str]
             facet.relation_tag[FacetOf] = entity
 
 
-def new_world() -> tcod.ecs.Registry:
-    """Return a newly created world."""
+def world_cave_seed(seed: int) -> int:
+    """Return the seed of the starting cave of the world made from `seed`."""
+    return Random(seed).getrandbits(64)
+
+
+def new_world(  # noqa: PLR0913
+    *,
+    seed: int | None = None,
+    width: int = 128,
+    height: int = 128,
+    orcs: int | None = None,
+    kobolds: int = 4,
+    cave: CaveConfig | None = None,
+    plan: CavePlan | None = None,
+) -> tcod.ecs.Registry:
+    """Return a newly created world.
+
+    `seed` makes the world generation and simulation reproducible.
+    `orcs` and `cave` are passed to :any:`plan_cave`, by default the number of orcs scales with the cave size.
+    `plan` is a starting cave already planned from :any:`world_cave_seed`, the map parameters are ignored with it.
+    """
     registry = tcod.ecs.Registry()
+    rng = registry[None].components[Random] = Random(seed)
     init_world(registry)
 
-    map_ = generate_cave_map(registry)
+    cave_seed = rng.getrandbits(64)
+    if plan is None:
+        plan = plan_cave(cave_seed, width, height, orcs, cave)
+    elif plan.seed != cave_seed:
+        msg = "The cave plan was not made from the seed of this world."
+        raise ValueError(msg)
+    map_ = build_cave_map(registry, plan)
+    height = map_.components[Shape].height
 
     player = registry["player"]
     player.tags |= {IsPlayer, Faction.Player, IsActor}
@@ -87,7 +117,10 @@ def new_world() -> tcod.ecs.Registry:
     force_move(player, Location(1, 32, map_))
     schedule(player, 0)
 
-    for p in [Location(1, 29, map_), Location(1, 30, map_), Location(2, 29, map_), Location(2, 30, map_)]:
-        spawn_actor(registry["kobold"], pos=p, ai=MinionAI(), faction=Faction.Player)
+    kobold_positions = [Location(1, 29, map_), Location(1, 30, map_), Location(2, 29, map_), Location(2, 30, map_)]
+    grass = Rect(1, 1, 14, height - 2)
+    for i in range(kobolds):
+        pos = kobold_positions[i] if i < len(kobold_positions) else grass.get_random_pos(map_)
+        spawn_actor(registry["kobold"], pos=pos, ai=MinionAI(), faction=Faction.Player)
 
     return registry
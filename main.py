@@ -4,6 +4,8 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
+import time
 import traceback
 from datetime import UTC, datetime
 from pathlib import Path
@@ -16,14 +18,18 @@
 from tcod.event import KeySym, Modifier
 
 import g
-from game.action_logic import simulate
 from game.components import Location
-from game.saving import load_world, save_world
+from game.frame_stats import FrameStats
+from game.pregen import Pregenerator
+from game.saving import Autosaver, load_world, save_world
+from game.sites import evict_idle_sites
 from game.states import InGame
 from game.world_init import new_world
 
 FONT = Path(__file__, "..", "assets/terminal8x12_gs_ro.png")
 
+logger = logging.getLogger(__name__)
+
 
 def main() -> None:
     """Main entry point."""
@@ -33,53 +39,103 @@ def main() -> None:
         traceback.print_exc()
         g.registry = new_world()
     if g.registry.Q.all_of(components=[Location], tags=["IsPlayer"]):
-        simulate(g.registry)
         g.state = InGame()
     else:
         raise AssertionError
+    g.pregen = Pregenerator()
+    g.pregen.prefetch_world()  # So that a new game is ready when asked for
     g.tileset = tcod.tileset.load_tilesheet(FONT, 16, 16, tcod.tileset.CHARMAP_CP437)
     tcod.tileset.procedural_block_elements(tileset=g.tileset)
     with tcod.context.new(tileset=g.tileset, width=1280, height=720) as g.context:
         try:
             main_loop()
         except Exception:
-            save_world(g.registry)
+            final_save()
             raise
         except SystemExit:
-            save_world(g.registry)
+            final_save()
             raise
+        finally:
+            g.pregen.shutdown()
+
+
+def final_save() -> None:
+    """Save the world on exit, every site but the active one is evicted first so that startup only loads that site."""
+    evict_idle_sites(g.registry, idle_ticks=0)
+    save_world(g.registry)
+
+
+def toggle_maximized() -> None:
+    """Maximize or restore the window."""
+    sdl_window = g.context.sdl_window
+    assert sdl_window
+    if sdl_window.flags & tcod.sdl.video.WindowFlags.MAXIMIZED:
+        sdl_window.restore()
+    else:
+        sdl_window.maximize()
 
 
-def main_loop() -> None:
-    """Main game loop."""
-    while True:
-        console = g.context.new_console(40, 20)
-        g.state.on_render(console)
-        g.context.present(console, keep_aspect=False, integer_scaling=True)
-        g.state.on_update()
-        for event in tcod.event.get():
-            match event:
-                case tcod.event.Quit():
-                    raise SystemExit
-                case tcod.event.KeyDown(mod=mod, sym=KeySym.RETURN | KeySym.RETURN2 | KeySym.RETURN) if (
-                    mod & Modifier.ALT
-                ):
-                    sdl_window = g.context.sdl_window
-                    assert sdl_window
-                    if sdl_window.flags & tcod.sdl.video.WindowFlags.MAXIMIZED:
-                        sdl_window.restore()
-                    else:
-                        sdl_window.maximize()
-                case tcod.event.KeyDown(sym=KeySym.PRINTSCREEN):
-                    base_path = Path("screenshots")
-                    base_path.mkdir(exist_ok=True)
-                    path = base_path / f"earth-dragons-den-{datetime.now(tz=UTC).isoformat()}.png".replace(":", "-")
-                    imageio.imsave(path, g.tileset.render(console))
-                case _:
-                    g.state = g.state.on_event(event) or g.state
+def main_loop(
+    simulation_budget_ms: float = 8, max_fps: float = 60, idle_timeout: float = 0.5, autosave_interval: float = 300
+) -> None:
+    """Main game loop.
+
+    At most `simulation_budget_ms` milliseconds of world simulation is run per frame, the rest continues next frame.
+    Frames are limited to `max_fps` and the console is only redrawn after events or when the state reports a change.
+    While the state is idle the loop waits on events for up to `idle_timeout` seconds instead of spinning.
+    Sites the player has left are evicted once idle and the world is saved in the background every
+    `autosave_interval` seconds.
+    """
+    g.simulation_budget = simulation_budget_ms / 1000
+    g.frame_stats = FrameStats()
+    autosaver = Autosaver(interval=autosave_interval)
+    frame_interval = 1 / max_fps
+    console = g.context.new_console(40, 20)
+    redraw = True
+    try:
+        while True:
+            frame_start = time.perf_counter()
+            if redraw:
+                console.clear()
+                g.state.on_render(console)
+                g.context.present(console, keep_aspect=False, integer_scaling=True)
+            changed = g.state.on_update()
+            if not isinstance(changed, bool):
+                g.state, changed = changed, True
+            evict_idle_sites(g.registry, writer=autosaver.submit)  # Written in order with the autosaves
+            autosaver.update(g.registry)
+            g.frame_stats.record(time.perf_counter() - frame_start, rendered=redraw)
+            redraw = changed
+            if changed:
+                time.sleep(max(0.0, frame_start + frame_interval - time.perf_counter()))
+                events = list(tcod.event.get())
+            else:
+                events = list(tcod.event.wait(timeout=idle_timeout))
+            for event in events:
+                redraw = True
+                match event:
+                    case tcod.event.Quit():
+                        raise SystemExit
+                    case tcod.event.WindowResized():
+                        console = g.context.new_console(40, 20)
+                    case tcod.event.KeyDown(mod=mod, sym=KeySym.RETURN | KeySym.RETURN2 | KeySym.RETURN) if (
+                        mod & Modifier.ALT
+                    ):
+                        toggle_maximized()
+                    case tcod.event.KeyDown(sym=KeySym.PRINTSCREEN):
+                        base_path = Path("screenshots")
+                        base_path.mkdir(exist_ok=True)
+                        path = base_path / f"earth-dragons-den-{datetime.now(tz=UTC).isoformat()}.png".replace(":", "-")
+                        imageio.imsave(path, g.tileset.render(console))
+                    case _:
+                        g.state = g.state.on_event(event) or g.state
+    finally:
+        autosaver.shutdown()  # Finish writing before the final save
+        logger.info("%s", g.frame_stats)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Generation workers of frozen builds
     if __debug__:
         logging.basicConfig(level=logging.INFO)
     main()
@@ -0,0 +1,31 @@
+"""Tests for saving and loading worlds."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Final
+
+from game.saving import LEGACY_SITE_NAME, load_world, read_site_index, save_world
+from game.sites import get_sites
+from game.stockpile import get_stored_gold
+
+LEGACY_SAVE: Final = Path(__file__).parent / "data" / "legacy_save.sav.xz"
+"""Save written before the container format and before sites, with gold stored in a treasury."""
+
+LEGACY_STORED_GOLD: Final = 77
+"""Gold stored in the treasury of :any:`LEGACY_SAVE`."""
+
+
+def test_legacy_stored_gold() -> None:
+    """The maps of legacy saves are sites whose stored gold is counted."""
+    registry = load_world(LEGACY_SAVE)
+    assert len(get_sites(registry)) == 1
+    assert get_stored_gold(registry) == LEGACY_STORED_GOLD
+
+
+def test_legacy_site_index(tmp_path: Path) -> None:
+    """Legacy maps are listed in the site index once saved again."""
+    path = tmp_path / "save.sav"
+    save_world(load_world(LEGACY_SAVE), path)
+    assert [site["name"] for site in read_site_index(path)] == [LEGACY_SITE_NAME]
+    assert get_stored_gold(load_world(path)) == LEGACY_STORED_GOLD